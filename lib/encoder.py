@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""
+Encode Bin, BCD and ASCII input to bits
+"""
+# Published under the MIT license
+#
+# Copyright 2020 Konstantin Köhring (@galaxy102)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+# to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions
+# of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import contextlib
+import io
+import mmap
+import sys
+
+try:
+    import numpy
+    slow = False
+except ImportError:
+    slow = True
+
+# Number of bytes read at once when encoding a file
+_CHUNK_SIZE = 1 << 16
+
+# Translation of the characters "0" and "1" to bit values
+_BIT_TABLE = bytes.maketrans(b"01", b"\x00\x01")
+# Translation of bit values to the characters "0" and "1"
+_TEXT_TABLE = bytes.maketrans(b"\x00\x01", b"01")
+
+# Bit values of all bytes (most significant bit first), indexed by the byte
+_BYTES = [format(byte, "08b").encode("ascii").translate(_BIT_TABLE) for byte in range(256)]
+
+if not slow:
+    # Bits of all nibbles (most significant bit first), indexed by the nibble
+    _NIBBLES = numpy.unpackbits(numpy.arange(16, dtype=numpy.uint8).reshape(-1, 1), axis=1)[:, 4:]
+
+
+def _as_bytes(text):
+    """
+    Convert a text to bytes
+    :param text: text (str or bytes)
+    :return: bytes of the text, non-ASCII characters are replaced by "?"
+    """
+    return text.encode("ascii", errors="replace") if isinstance(text, str) else bytes(text)
+
+
+def encode_binary(text):
+    """
+    Encode a string of "0" and "1" characters
+    :param text: binary input (str or bytes), e.g. "0110"
+    :return: bytes of bit values (one byte of 0 or 1 per bit)
+    :raise ValueError: text is not binary
+    """
+    bits = _as_bytes(text).translate(_BIT_TABLE)
+    if bits.strip(b"\x00\x01"):
+        raise ValueError("Invalid binary input.")
+    return bits
+
+
+def encode_ascii(text):
+    """
+    Encode a string as 7-bit ASCII
+    :param text: ASCII input (str or bytes), e.g. "Hi"
+    :return: bytes of bit values (one byte of 0 or 1 per bit)
+    :raise ValueError: text is not ASCII
+    """
+    if not text.isascii():
+        raise ValueError("Invalid ASCII input.")
+    if slow:
+        return "".join(format(char, "07b") for char in _as_bytes(text)).encode("ascii").translate(_BIT_TABLE)
+    chars = numpy.frombuffer(_as_bytes(text), dtype=numpy.uint8).reshape(-1, 1)
+    # Unpack each character to 8 bits and drop the (always zero) most significant one
+    return numpy.unpackbits(chars, axis=1)[:, 1:].tobytes()
+
+
+def encode_bcd(text):
+    """
+    Encode a string of decimal digits as 4-bit BCD
+    :param text: decimal input (str or bytes), e.g. "42"
+    :return: bytes of bit values (one byte of 0 or 1 per bit)
+    :raise ValueError: text is not decimal
+    """
+    if not (text.isascii() and (text.isdigit() or not text)):
+        raise ValueError("Invalid decimal input.")
+    if slow:
+        return "".join(format(digit - ord("0"), "04b") for digit in _as_bytes(text)).encode("ascii").translate(
+            _BIT_TABLE)
+    digits = numpy.frombuffer(_as_bytes(text), dtype=numpy.uint8) - ord("0")
+    return _NIBBLES[digits].tobytes()
+
+
+def to_text(bits):
+    """
+    Convert bits to a string of "0" and "1" characters
+    :param bits: bytes of bit values (or sequence of "0" and "1")
+    :return: binary string
+    """
+    if isinstance(bits, (bytes, bytearray)):
+        return bits.translate(_TEXT_TABLE).decode("ascii")
+    return "".join(str(int(val)) for val in bits)
+
+
+def open_input(path):
+    """
+    Open an input file for encode_stream
+    :param path: path of the file, "-" for stdin
+    :return: context manager of the binary file object
+    """
+    if path == "-":
+        # Do not close stdin when leaving the context
+        return contextlib.nullcontext(sys.stdin.buffer)
+    return open(path, "rb")
+
+
+def encode_stream(file, digest=None, chunk_size=_CHUNK_SIZE):
+    """
+    Encode a formatted input read from a file chunk by chunk
+    The input is formatted like on the command line: [|d_|a_] + text. Line breaks are ignored in binary and BCD input,
+    in ASCII input only trailing line breaks are ignored.
+    :param file: binary file object to read from
+    :param digest: hashlib object to update with the raw input, e.g. for naming the output
+    :param chunk_size: number of bytes to read at once
+    :return: generator of bytes of bit values (one byte of 0 or 1 per bit)
+    :raise ValueError: Malformed input
+    """
+    # The first chunk needs to contain the whole prefix
+    chunk = file.read(max(chunk_size, 2))
+    if digest is not None:
+        digest.update(chunk)
+    encode = {b"a_": encode_ascii, b"d_": encode_bcd}.get(chunk[:2], encode_binary)
+    if encode is not encode_binary:
+        chunk = chunk[2:]
+    pending = b""  # Line breaks which are only kept if more text follows
+    empty = True
+    while True:
+        if encode is encode_ascii:
+            chunk = pending + chunk
+            text = chunk.rstrip(b"\r\n")
+            pending = chunk[len(text):]
+        else:
+            text = chunk.translate(None, b"\r\n")
+        if text:
+            empty = False
+            yield encode(text)
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        if digest is not None:
+            digest.update(chunk)
+    if empty:
+        raise ValueError("Invalid input.")
+
+
+def encode_bytes(data):
+    """
+    Encode raw bytes with 8 bits per byte (most significant bit first)
+    :param data: bytes-like object
+    :return: bytes of bit values (one byte of 0 or 1 per bit)
+    """
+    if slow:
+        return b"".join(map(_BYTES.__getitem__, data))
+    return numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8)).tobytes()
+
+
+def encode_raw(file, digest=None, chunk_size=_CHUNK_SIZE):
+    """
+    Encode the raw content of a file with 8 bits per byte (most significant bit first) window by window
+    Regular files are memory-mapped, so they are never read as a whole.
+    :param file: binary file object to read from
+    :param digest: hashlib object to update with the raw input, e.g. for naming the output
+    :param chunk_size: number of bytes to encode at once
+    :return: generator of bytes of bit values (one byte of 0 or 1 per bit)
+    """
+    try:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        # Not mappable (e.g. a pipe or an empty file), read it instead
+        data = None
+    if data is None:
+        windows = iter(lambda: file.read(chunk_size), b"")
+    else:
+        windows = (data[idx:idx + chunk_size] for idx in range(0, len(data), chunk_size))
+    try:
+        for window in windows:
+            if digest is not None:
+                digest.update(window)
+            yield encode_bytes(window)
+    finally:
+        if data is not None:
+            data.close()
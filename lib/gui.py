@@ -24,17 +24,12 @@
 import logging
 import sys
 import re
+import threading
 
-# Try starting GUI, else use text input
-try:
-    import tkinter
-    import tkinter.messagebox
+import lib.encoder
 
-    gui = True
-except ImportError:
-    gui = False
-    logging.log(logging.ERROR, "Could not load GUI module. Is tkinter installed?")
-    logging.log(logging.ERROR, "Falling back to text input.")
+# GUI module, only loaded when the GUI is started (see _load_gui)
+tkinter = None
 
 # First Run flag for CLI to display header
 _first_run = True
@@ -42,10 +37,19 @@ _first_run = True
 # Background Color for GUI
 _BG_COLOR = "darkgray"
 
+# Interval to check a background calculation of the GUI for progress in ms
+_POLL_INTERVAL = 50
+
+# Delay of the live preview after the last change of the input in ms
+_PREVIEW_DELAY = 200
+
+# Longer inputs are not previewed while typing (e.g. when they are pasted), they are to be calculated in the background
+_MAX_PREVIEW_BITS = 100000
+
 # Patterns for input evaluation
 _BINARY_PATTERN = re.compile("[01]+")
 _ASCII_PATTERN = re.compile("a_.+", flags=re.ASCII)
-_DECIMAL_PATTERN = re.compile("d_\d+")
+_DECIMAL_PATTERN = re.compile("d_[0-9]+")
 
 # Translation from human readable types to machine readable prefixes
 _PRE_MAP = {"1-bit Binary":               "",
@@ -53,48 +57,123 @@ _PRE_MAP = {"1-bit Binary":               "",
             "7-bit ASCII":                "a_"}
 
 
-def _evaluate_btn(pre: tkinter.StringVar, inp: tkinter.Entry):
+def _load_gui():
     """
-    Evaluate the GUI content
+    Try loading the GUI module
+    :return: True if the GUI can be used, else text input is to be used
+    """
+    global tkinter
+    try:
+        import tkinter
+        import tkinter.messagebox
+    except ImportError:
+        logging.log(logging.ERROR, "Could not load GUI module. Is tkinter installed?")
+        logging.log(logging.ERROR, "Falling back to text input.")
+        return False
+    return True
+
+
+class _Cancelled(Exception):
+    """
+    Raised to abort a background calculation of the GUI
+    """
+
+
+class _Job(threading.Thread):
+    """
+    Background calculation of the GUI, evaluates the input and calculates the waveforms in a worker thread
+    The calculation is aborted at the next progress report after cancel() is called.
+    """
+
+    def __init__(self, text, calculate):
+        """
+        Prepare the calculation
+        :param text: [|d_|a_] + text input (see _evaluate_input)
+        :param calculate: function to call with the evaluated input and a progress function (see start)
+        """
+        super().__init__(daemon=True)
+        self.text = text
+        self.calculate = calculate
+        self.fraction = 0.0
+        self.inp = None
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+
+    def _progress(self, fraction):
+        """
+        Record the progress of the calculation
+        :param fraction: calculated fraction (0.0 .. 1.0)
+        :raise _Cancelled: the calculation has been cancelled
+        """
+        self.fraction = fraction
+        if self._cancelled.is_set():
+            raise _Cancelled()
+
+    def cancel(self):
+        """
+        Abort the calculation
+        """
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            self.inp = _evaluate_input(self.text)
+            self._progress(0.0)
+            self.result = self.calculate(self.inp, self._progress)
+        except Exception as e:
+            # Reported by the GUI
+            self.error = e
+
+
+def _input_text(pre: "tkinter.StringVar", inp: "tkinter.Entry"):
+    """
+    Get the GUI content
     :param pre: Prefix selector
     :param inp: Input Field
-    :return: evaluated GUI content
+    :return: GUI content with prefix (see _evaluate_input)
     """
     prefix = pre.get()
     for key in _PRE_MAP.keys():
         prefix = prefix.replace(key, _PRE_MAP[key])
-    return _evaluate_input(prefix + inp.get())
+    return prefix + inp.get()
+
+
+def _evaluate_btn(pre: "tkinter.StringVar", inp: "tkinter.Entry"):
+    """
+    Evaluate the GUI content
+    :param pre: Prefix selector
+    :param inp: Input Field
+    :return: evaluated GUI content
+    """
+    return _evaluate_input(_input_text(pre, inp))
 
 
 def _evaluate_input(inp):
     """
     Evaluate a given text string (eventually containing a prefix)
     :param inp: [|d_|a_] + text input. No prefix means interpretation as binary, d_ means BCD, a_ means ASCII
-    :return: tuple of bit-representation of the input string
+    :return: bytes of the bit-representation of the input string (one byte of 0 or 1 per bit)
     :raise ValueError: Malformed input
     """
     # Initialize output
-    bit_string = None
+    bits = None
     if re.fullmatch(_BINARY_PATTERN, inp):
         # Detected bin
-        bit_string = inp
-    elif re.fullmatch(_ASCII_PATTERN, inp):
+        bits = lib.encoder.encode_binary(inp)
+    elif re.fullmatch(_ASCII_PATTERN, inp) and inp.isascii():
         # Detected ASCII
-        bit_string = ""
-        for i in inp[2:]:
-            bit_string += "{:07b}".format(ord(i))
+        bits = lib.encoder.encode_ascii(inp[2:])
     elif re.fullmatch(_DECIMAL_PATTERN, inp):
         # Detected BCD
-        bit_string = ""
-        for i in inp[2:]:
-            bit_string += "{:04b}".format(int(i))
-    if bit_string is not None:
+        bits = lib.encoder.encode_bcd(inp[2:])
+    if bits is not None:
         # Evaluation successful
-        logging.log(logging.DEBUG, "Evaluated {} to {}.".format(inp, bit_string))
-        return tuple(bit_string)
+        logging.log(logging.DEBUG, "Evaluated input of {} characters to {} bits.".format(len(inp), len(bits)))
+        return bits
     else:
         # Evaluation failed
-        logging.log(logging.WARN, "Could not evaluate {}.".format(inp))
+        logging.log(logging.WARN, "Could not evaluate {}.".format(inp[:80]))
         raise ValueError("Invalid input.")
 
 
@@ -138,14 +217,78 @@ def _nogui(callback):
             sys.exit(130)
 
 
-def _gui(callback):
+def _gui(callback, calculate=None, embed=None):
     """
     Run the GUI
     :param callback: function to call on end of input
+    :param calculate: function to run in the background before callback (see start)
+    :param embed: function to embed the output into the window (see start)
     """
+    job = None
+    preview = None
+    pending = None
+
+    def run():
+        nonlocal job
+        if job is not None:
+            return
+        if calculate is None:
+            callback(_evaluate_btn(prefix, entry))
+            return
+        job = _Job(_input_text(prefix, entry), calculate)
+        job.start()
+        calc_btn.configure(state=tkinter.DISABLED)
+        cancel_btn.configure(state=tkinter.NORMAL)
+        main.after(_POLL_INTERVAL, poll)
+
+    def poll():
+        nonlocal job
+        if job.is_alive():
+            status.set("Calculating: {:.0%}".format(job.fraction))
+            main.after(_POLL_INTERVAL, poll)
+            return
+        finished, job = job, None
+        calc_btn.configure(state=tkinter.NORMAL)
+        cancel_btn.configure(state=tkinter.DISABLED)
+        if isinstance(finished.error, _Cancelled):
+            status.set("Cancelled.")
+            return
+        status.set("")
+        if finished.error is not None:
+            raise finished.error
+        callback(finished.inp, finished.result)
+
+    def cancel():
+        if job is not None:
+            job.cancel()
+            status.set("Cancelling...")
+
+    def schedule_preview(*_):
+        # Only the last change within the delay is previewed
+        nonlocal pending
+        if pending is not None:
+            main.after_cancel(pending)
+        pending = main.after(_PREVIEW_DELAY, show_preview) if live.get() else None
+
+    def show_preview():
+        nonlocal pending
+        pending = None
+        if job is not None or not text.get():
+            return
+        try:
+            inp = _evaluate_input(_input_text(prefix, entry))
+        except ValueError as e:
+            status.set(str(e))
+            return
+        if len(inp) > _MAX_PREVIEW_BITS:
+            status.set("Input too long for the live preview, please calculate it.")
+            return
+        status.set("")
+        preview(inp)
+
     main = tkinter.Tk()
     main.title("Waveform Modulator")
-    main.geometry("640x480")
+    main.geometry("640x480" if embed is None else "1024x768")
     main.configure(background=_BG_COLOR)
     main.report_callback_exception = lambda e, v, tb: tkinter.messagebox.showerror("Error", str(v))
     head = tkinter.Frame(main, background=_BG_COLOR)
@@ -157,10 +300,11 @@ def _gui(callback):
     inp = tkinter.Frame(main, width=400, height=20, background=_BG_COLOR)
     inp.pack_propagate(False)
     tkinter.Label(inp, text="To Modulate:", font="-size 14", background=_BG_COLOR).pack(side=tkinter.LEFT)
-    entry = tkinter.Entry(inp, width=30)
+    text = tkinter.StringVar()
+    entry = tkinter.Entry(inp, width=30, textvariable=text)
     entry.pack(side=tkinter.RIGHT)
     inp.pack(expand=False)
-    sel = tkinter.Frame(main, width=400, height=200, background=_BG_COLOR)
+    sel = tkinter.Frame(main, width=400, height=200 if embed is None else 40, background=_BG_COLOR)
     sel.pack_propagate(False)
     tkinter.Label(sel, text="Encoding:", font="-size 14", background=_BG_COLOR).pack(side=tkinter.LEFT)
     prefix = tkinter.StringVar()
@@ -171,28 +315,51 @@ def _gui(callback):
     sel.pack()
     exe = tkinter.Frame(main, width=400, height=40, background=_BG_COLOR)
     exe.pack_propagate(False)
-    tkinter.Button(exe, text="Calculate", command=lambda: callback(_evaluate_btn(prefix, entry))).pack(
-        side=tkinter.LEFT, expand=True, fill="x")
+    calc_btn = tkinter.Button(exe, text="Calculate", command=run)
+    calc_btn.pack(side=tkinter.LEFT, expand=True, fill="x")
+    tkinter.Label(exe, text="", background=_BG_COLOR).pack(padx=5, side=tkinter.LEFT)
+    cancel_btn = tkinter.Button(exe, text="Cancel", command=cancel, state=tkinter.DISABLED)
+    cancel_btn.pack(side=tkinter.LEFT, expand=True, fill="x")
     tkinter.Label(exe, text="", background=_BG_COLOR).pack(padx=5, side=tkinter.LEFT)
     tkinter.Button(exe, text="Quit", command=lambda: sys.exit(0)).pack(side=tkinter.RIGHT, expand=True, fill="x")
     exe.pack()
+    status = tkinter.StringVar()
+    tkinter.Label(main, textvariable=status, background=_BG_COLOR).pack(pady=5)
+    live = tkinter.BooleanVar()
+    if embed is not None:
+        out = tkinter.Frame(main, background=_BG_COLOR)
+        out.pack(fill="both", expand=True)
+        callback, preview = embed(out)
+    if preview is not None:
+        live.set(True)
+        tkinter.Checkbutton(main, text="Live preview", variable=live, command=schedule_preview,
+                            background=_BG_COLOR, highlightthickness=0).pack(before=out)
+        text.trace_add("write", schedule_preview)
+        prefix.trace_add("write", schedule_preview)
     entry.focus()
-    main.resizable(width=False, height=False)
-    main.bind("<Return>", lambda x: callback(_evaluate_btn(prefix, entry)))
-    main.bind("<KP_Enter>", lambda x: callback(_evaluate_btn(prefix, entry)))
+    main.resizable(width=embed is not None, height=embed is not None)
+    main.bind("<Return>", lambda x: run())
+    main.bind("<KP_Enter>", lambda x: run())
     main.mainloop()
 
 
-def start(callback, force_nogui=False):
+def start(callback, force_nogui=False, calculate=None, embed=None):
     """
     Start CLI or GUI
     :param callback: function to call on end of input
     :param force_nogui: True if CLI should be used
+    :param calculate: function to call with the input and a progress function in a worker thread of the GUI, its result
+                      is passed to callback as second argument. The progress function is to be called with the
+                      calculated fraction (0.0 .. 1.0) and raises an exception to abort if the calculation is cancelled.
+                      None to call callback with the input only. The CLI calls callback with the input only.
+    :param embed: function to call with a frame of the GUI window to embed the output into. It returns the callback
+                  to use in the GUI instead of callback and a function to call with the input while it is typed
+                  (live preview, None for none). None to leave the output to callback.
     """
     logging.log(logging.DEBUG, "Starting UI.")
-    if gui and not force_nogui:
+    if not force_nogui and _load_gui():
         logging.log(logging.DEBUG, "Using GUI.")
-        _gui(callback)
+        _gui(callback, calculate, embed)
     else:
         logging.log(logging.DEBUG, "Using CLI.")
         _nogui(callback)
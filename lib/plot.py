@@ -24,74 +24,485 @@ Plot Waveforms for AM, FM and PM modulation of binary codes
 
 import logging
 import sys
+import threading
+
+import lib.encoder
+import lib.waveform
 
 try:
-    import matplotlib.pyplot as plt
+    import matplotlib.backends.backend_agg
+    import matplotlib.figure
+    import matplotlib.ticker
+    import numpy
 except ImportError:
-    logging.log(logging.ERROR, "Could not load PyPlot. Please download and install Matplotlib.")
+    logging.log(logging.ERROR, "Could not load Matplotlib. Please download and install Matplotlib.")
     sys.exit(1)
 
+# Charts to show are drawn into the same PyPlot figure, so the figure and its axes are only created once per process
+_FIGURE = "Waveforms"
+
+# Charts to save are drawn into a figure of the thread without PyPlot, so they can be saved from several threads at once
+_FILE_FIGURES = threading.local()
+
+# Waves are decimated to this many columns per pixel of the figure width, if they have far more samples
+_DECIMATION_OVERSAMPLING = 2
+
+# Inputs up to this many bits get a boundary line and a label for every bit, longer inputs get about _CYCLE_MARKS
+# evenly spaced marks at round cycle numbers
+_MAX_BIT_MARKS = 64
+_CYCLE_MARKS = 20
+# Labels of every bit may take this many digits in total (two digits each for _MAX_BIT_MARKS bits), windows starting at
+# high cycle numbers get evenly spaced labels instead
+_MAX_LABEL_DIGITS = 2 * _MAX_BIT_MARKS
+
+# Inputs typed into the embedded chart are shown on axes of at least this many bits (see PlotCanvas)
+_MIN_PREVIEW_BITS = 8
+
+# Longer inputs are cut off in the title (they would not fit, but still take long to draw)
+_MAX_TITLE_LENGTH = 80
+
+# Vertical ranges of the subplots of the values and of the waves
+_VALUES_RANGE = (-0.1, 1.1)
+_WAVE_RANGE = (-1.1, 1.1)
+
+
+def _decimate(t, wave, columns):
+    """
+    Reduce a wave to the first, minimum, maximum and last sample of each column (M4 decimation)
+    A line through these samples is drawn like the line through all samples, if there is at least one column per pixel.
+    :param t: time array or lib.waveform.TimeAxis
+    :param wave: wave amplitude array
+    :param columns: number of columns to reduce to
+    :return: time and wave arrays, the given ones if decimation does not reduce the number of samples
+    """
+    per_column = -(-len(wave) // columns)
+    if per_column <= 4:
+        return t, wave
+    return _decimate_columns(t, wave, per_column)
+
+
+def _decimate_columns(t, wave, per_column, start=0):
+    """
+    Reduce the samples of a wave from a column on to four samples per column (see _decimate)
+    :param t: time array or lib.waveform.TimeAxis
+    :param wave: wave amplitude array
+    :param per_column: number of samples per column
+    :param start: index of the first column to reduce
+    :return: time and wave arrays of the reduced columns
+    """
+    length = len(wave)
+    low = start * per_column
+    wave = numpy.asarray(wave)
+    columns = -(-(length - low) // per_column)
+    # The last column is padded with the last sample
+    blocks = numpy.pad(wave[low:], (0, columns * per_column - (length - low)), mode="edge").reshape(columns, per_column)
+    idx = numpy.empty((columns, 4), dtype=numpy.intp)
+    idx[:, 0] = 0
+    idx[:, 1] = blocks.argmin(axis=1)
+    idx[:, 2] = blocks.argmax(axis=1)
+    idx[:, 3] = per_column - 1
+    # Keep the samples of each column in order of time
+    idx.sort(axis=1)
+    idx = numpy.minimum(idx + numpy.arange(low, low + columns * per_column, per_column)[:, numpy.newaxis],
+                        length - 1).ravel()
+    if isinstance(t, lib.waveform.TimeAxis):
+        t_dec = (idx + t.offset) / t.steps
+    else:
+        t_dec = numpy.asarray(t)[idx]
+    return t_dec, wave[idx]
+
+
+def _first_cycle(t):
+    """
+    Get the cycle a waveform starts at, which is not 0 for a window of a longer waveform
+    :param t: time array or lib.waveform.TimeAxis
+    :return: index of the first cycle
+    """
+    return int(round(t[0])) if len(t) else 0
+
+
+def _cycle_marks(first, bits):
+    """
+    Get the cycles to mark with boundary lines and labels
+    :param first: first cycle shown (see _first_cycle)
+    :param bits: number of bits shown
+    :return: cycles to draw boundary lines at, cycles to label
+    """
+    if bits <= _MAX_BIT_MARKS and bits * len(str(first + bits)) <= _MAX_LABEL_DIGITS:
+        return range(first, first + bits), range(first, first + bits + 1)
+    marks = matplotlib.ticker.MaxNLocator(nbins=_CYCLE_MARKS, integer=True).tick_values(first, first + bits)
+    marks = marks[(marks >= first) & (marks <= first + bits)].astype(int)
+    return (range(first, first + bits) if bits <= _MAX_BIT_MARKS else marks), marks
+
+
+def _title(values):
+    """
+    Get the title of a chart
+    :param values: actual code to modulate (see plot_waveforms)
+    :return: title text
+    """
+    text = lib.encoder.to_text(values[:_MAX_TITLE_LENGTH + 1])
+    if len(text) > _MAX_TITLE_LENGTH:
+        text = text[:_MAX_TITLE_LENGTH] + "\u2026"
+    # Newline needed for vertical space
+    return "\nModulations of {}\n".format(text)
+
+
+def _values_line(values, t, steps):
+    """
+    Get the points of the line of the values
+    :param values: actual code to modulate (see plot_waveforms)
+    :param t: time array or lib.waveform.TimeAxis
+    :param steps: steps used in calculation
+    :return: time and value lists to draw with drawstyle "steps-post"
+    """
+    # Tricky as steps are unidirectional in mpl, the last value is repeated at the end of the time
+    t_ax = list(t[::steps])
+    t_ax.append(t[-1])
+    values_ax = [int(val) for val in values]
+    values_ax.append(int(values[-1]))
+    return t_ax, values_ax
+
+
+def _values_array(values):
+    """
+    Get the bit values of a code
+    :param values: actual code to modulate (see plot_waveforms)
+    :return: numpy array of bits (dtype uint8, not a copy for bytes)
+    """
+    if isinstance(values, (bytes, bytearray)):
+        return numpy.frombuffer(values, dtype=numpy.uint8)
+    return numpy.fromiter((int(val) for val in values), dtype=numpy.uint8, count=len(values))
+
 
-def _plot_waveform(t, wave, subplot, fmt, label, steps):
+def _wave_line(fig, t, wave):
+    """
+    Get the points of the line of a wave
+    :param fig: the figure to draw the wave into
+    :param t: time array or lib.waveform.TimeAxis
+    :param wave: wave amplitude array
+    :return: time and amplitude arrays
+    """
+    # A long wave is drawn from its samples per pixel column only, so the drawing time does not depend on its length
+    t_plot, wave_plot = _decimate(t, wave, int(fig.get_figwidth() * fig.dpi * _DECIMATION_OVERSAMPLING))
+    return t_plot, lib.waveform.as_float(wave_plot)
+
+
+def _plot_waveform(axes, t, wave, fmt, label, steps, boundaries):
     """
     Create Subplot for the given Waveform
-    :param t: time array
+    :param axes: axes of the subplot
+    :param t: time array or lib.waveform.TimeAxis
     :param wave: wave amplitude array
-    :param subplot: subplot index
     :param fmt: PyPlot format code
     :param label: label for legend
     :param steps: steps used in calculation
+    :param boundaries: cycles to draw boundary lines at (see _cycle_marks)
     """
-    plt.subplot(subplot)
-    plt.plot(t, wave, fmt, label=label)
-    plt.xlim(0, len(wave) / steps)
-    plt.vlines(t[::steps], -1.1, 1.1, ls="dotted")
-    plt.ylim(-1.1, 1.1)
-    plt.xticks([], [])
-    plt.yticks([-1, 0, 1], [-1, 0, 1])
+    axes.plot(*_wave_line(axes.get_figure(), t, wave), fmt, label=label)
+    first = _first_cycle(t)
+    axes.set_xlim(first, first + len(wave) / steps)
+    axes.vlines(boundaries, *_WAVE_RANGE, ls="dotted")
+    axes.set_ylim(*_WAVE_RANGE)
+    axes.set_xticks([])
+    axes.set_yticks([-1, 0, 1])
+    axes.set_yticklabels([-1, 0, 1])
 
 
-def plot_waveforms(values, t, am, fm, pm, target="show", filename=None):
+def _file_figure():
     """
-    Show or save waveform plots
-    :param values: actual code to modulate
-    :param t: time array
-    :param am: wave array for amplitude modulation
-    :param fm: wave array for frequency modulation
-    :param pm: wave array for phase modulation
-    :param target: "show" - display the plot, "file" - save the plot to the given file
-    :param filename: file name to save the plot to, if target is "file"
-    :raise RuntimeError: target and/or filename mismatch
+    Get the chart figure of the current thread for file output, it is rendered by Agg without PyPlot
+    :return: the figure
+    """
+    fig = getattr(_FILE_FIGURES, "figure", None)
+    if fig is None:
+        fig = matplotlib.figure.Figure(figsize=(16, 8))
+        matplotlib.backends.backend_agg.FigureCanvasAgg(fig)
+        _FILE_FIGURES.figure = fig
+    return fig
+
+
+def _clear_figure(fig):
+    """
+    Clear the axes and legends of a figure, the axes are kept for the next chart
+    :param fig: the figure
+    """
+    for axes in fig.axes:
+        axes.clear()
+    for legend in list(fig.legends):
+        legend.remove()
+
+
+def _prepare_figure(fig, rows):
+    """
+    Get cleared axes for the subplots of a chart, the axes of the figure are reused if they match
+    :param fig: the figure
+    :param rows: number of subplots
+    :return: list of axes, one per subplot
+    """
+    if len(fig.axes) != rows:
+        fig.clear()
+        for idx in range(rows):
+            fig.add_subplot(rows, 1, idx + 1)
+    else:
+        _clear_figure(fig)
+    # Start the layout from scratch (tight_layout adjusts the subplot parameters), so the chart does not depend on the
+    # previous one
+    fig.subplots_adjust(**{key: matplotlib.rcParams["figure.subplot.{}".format(key)]
+                           for key in ("left", "bottom", "right", "top", "wspace", "hspace")})
+    return fig.axes
+
+
+def _draw_waveforms(fig, values, t, waves):
+    """
+    Draw the waveform plots into a figure
+    :param fig: the figure
+    :param values: actual code to modulate (see plot_waveforms)
+    :param t: time array or lib.waveform.TimeAxis
+    :param waves: list of (wave array, PyPlot format code, label) to plot below the values
     """
     steps = int(len(t) / len(values))
-    plt.figure(figsize=(16, 8))
-    plt.subplot(411)
-    plt.title("\nModulations of {}\n".format("".join(values)))  # Newline needed for vertical space
-    # Plot values (tricky as steps are unidirectional in mpl)
-    t_ax = list(t[::steps])
-    t_ax.append(t[-1])
-    values_ax = [int(val) for val in values]
-    values_ax.append(int(values[-1]))
-    plt.plot(t_ax, values_ax, ds="steps-post", label="Data")
-    plt.xlim(0, len(values))
-    plt.vlines(t[::steps], -0.1, 1.1, ls="dotted")
-    plt.ylim(-0.1, 1.1)
-    plt.xticks([], [])
-    plt.yticks([0, 1], [0, 1])
-    for wave in ((am, 412, "g-", "AM"),
-                 (fm, 413, "r-", "FM"),
-                 (pm, 414, "c-", "PM")):
-        _plot_waveform(t, *wave, steps)
+    rows = len(waves) + 1
+    boundaries, ticks = _cycle_marks(_first_cycle(t), len(values))
+    axes = _prepare_figure(fig, rows)
+    axes[0].set_title(_title(values))
+    # Plot values
+    axes[0].plot(*_values_line(values, t, steps), ds="steps-post", label="Data")
+    axes[0].set_xlim(_first_cycle(t), _first_cycle(t) + len(values))
+    axes[0].vlines(boundaries, *_VALUES_RANGE, ls="dotted")
+    axes[0].set_ylim(*_VALUES_RANGE)
+    axes[0].set_xticks([])
+    axes[0].set_yticks([0, 1])
+    axes[0].set_yticklabels([0, 1])
+    for ax, (wave, fmt, label) in zip(axes[1:], waves):
+        _plot_waveform(ax, t, wave, fmt, label, steps, boundaries)
     # Plot ticks
-    plt.xticks([i for i in range(len(values) + 1)], [i for i in range(len(values) + 1)])
-    plt.xlabel("Cycle")
+    axes[-1].set_xticks(list(ticks))
+    axes[-1].set_xticklabels(list(ticks))
+    axes[-1].set_xlabel("Cycle")
     # Prettify the output and display legend
-    plt.figlegend(loc=(0.4225, 0.025), ncol=4)
-    plt.tight_layout(rect=(0.05, 0.05, 1, 1))
+    if rows == 4:
+        # All modulations: the original placement
+        fig.legend(loc=(0.4225, 0.025), ncol=4)
+    else:
+        # Fewer entries are centered below the chart
+        fig.legend(loc="lower center", bbox_to_anchor=(0.5, 0.025), ncol=rows)
+    fig.tight_layout(rect=(0.05, 0.05, 1, 1))
+
+
+class PlotCanvas:
+    """
+    Chart embedded into a Tk widget
+    New waveforms update the lines of the chart in place, which are then blitted onto the canvas. The axes are only
+    redrawn if the shown cycles change, the chart is only rebuilt if the modulations change. While the input is typed
+    (fit=False), the shown cycles grow in powers of two and only the points of changed bits are calculated again.
+    """
+
+    def __init__(self, master):
+        """
+        Create the chart
+        :param master: Tk widget to pack the chart into
+        """
+        # The Tk backend is only loaded if a chart is embedded
+        import matplotlib.backends.backend_tkagg
+        self.figure = matplotlib.figure.Figure(figsize=(10, 5))
+        self.canvas = matplotlib.backends.backend_tkagg.FigureCanvasTkAgg(self.figure, master)
+        self.canvas.get_tk_widget().pack(side="top", fill="both", expand=True)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self._labels = None
+        # First cycle and number of bits shown on the axes
+        self._window = None
+        self._background = None
+        # Bits, first interval of each wave and decimated wave lines of the last update with fit=False
+        self._bits = None
+        self._heads = None
+        self._lines = None
+
+    def _animated(self):
+        """
+        Get the artists which are updated in place
+        :return: list of the title, the line of the values and the lines of the waves
+        """
+        axes = self.figure.axes
+        return [axes[0].title] + [ax.lines[0] for ax in axes]
+
+    def _on_draw(self, event):
+        """
+        Store the background of the chart after it has been drawn and draw the artists which are updated in place
+        :param event: draw event
+        """
+        if self._labels is None:
+            return
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self._animated():
+            self.figure.draw_artist(artist)
+
+    def _shown(self, first, bits, fit):
+        """
+        Get the cycles to show
+        :param first: first cycle of the waves
+        :param bits: number of bits of the waves
+        :param fit: True to fit the axes to the bits, False to keep them while the bits fit in
+        :return: first cycle and number of bits to show
+        """
+        if fit:
+            return first, bits
+        if self._window[0] == first and self._window[1] // 4 < bits <= self._window[1]:
+            return self._window
+        return first, max(_MIN_PREVIEW_BITS, 1 << (bits - 1).bit_length())
+
+    def _set_window(self, window):
+        """
+        Lay out the axes for the shown cycles
+        :param window: first cycle and number of bits to show
+        """
+        first, bits = window
+        boundaries, ticks = _cycle_marks(first, bits)
+        axes = self.figure.axes
+        for ax in axes:
+            ax.set_xlim(first, first + bits)
+            ax.collections[0].remove()
+            ax.vlines(boundaries, *(_VALUES_RANGE if ax is axes[0] else _WAVE_RANGE), ls="dotted")
+        axes[-1].set_xticks(list(ticks))
+        axes[-1].set_xticklabels(list(ticks))
+        self._window = window
+
+    def _line_points(self, idx, data, t, per_column, prefix, convert):
+        """
+        Get the points of a line, only the columns from the given prefix on are reduced again
+        :param idx: index of the line in the cache
+        :param data: samples of the line (bits or wave array)
+        :param t: time array or lib.waveform.TimeAxis of the samples
+        :param per_column: number of samples per column (see _decimate)
+        :param prefix: number of leading samples which are unchanged since the last call
+        :param convert: function to convert samples to the values of the line
+        :return: time and value arrays of the line
+        """
+        if per_column <= 4:
+            return t, convert(data)
+        t_dec, data_dec = self._lines[1][idx]
+        # The last column may hold fewer samples than per_column, so it is reduced again if it grows
+        start = min(prefix // per_column, len(t_dec) // 4)
+        t_new, data_new = _decimate_columns(t, data, per_column, start)
+        t_dec = numpy.concatenate((t_dec[:start * 4], t_new))
+        data_dec = numpy.concatenate((data_dec[:start * 4], convert(data_new)))
+        self._lines[1][idx] = (t_dec, data_dec)
+        return t_dec, data_dec
+
+    def _set_lines(self, values, t, waves, steps):
+        """
+        Update the lines of the values and the waves, only the points of the bits following the common prefix of the
+        previous and the new values are calculated again
+        The lines are decimated to one column per pixel (see _decimate). The waves of the common prefix are expected to
+        be unchanged, unless the phase at the start of the waves has changed (this changes their first interval).
+        :param values: actual code to modulate (see plot_waveforms)
+        :param t: time array or lib.waveform.TimeAxis
+        :param waves: list of (wave array, PyPlot format code, label) to plot below the values
+        :param steps: steps used in calculation
+        """
+        bits = _values_array(values)
+        waves = [wave for wave, fmt, label in waves]
+        heads = [numpy.array(wave[:steps]) for wave in waves]
+        columns = max(1, int(self.figure.axes[0].get_window_extent().width))
+        prefix = 0
+        if self._lines is not None and self._lines[0] == (self._window, columns) and \
+                all(numpy.array_equal(old, new) for old, new in zip(self._heads, heads)):
+            length = min(len(bits), len(self._bits))
+            diff = numpy.flatnonzero(self._bits[:length] != bits[:length])
+            prefix = int(diff[0]) if len(diff) else length
+        else:
+            self._lines = ((self._window, columns), [(numpy.empty(0), numpy.empty(0)) for _ in range(len(waves) + 1)])
+        self._bits, self._heads = bits.copy(), heads
+        axes = self.figure.axes
+        axes[0].set_title(_title(values))
+        first = _first_cycle(t)
+        t_ax, values_ax = self._line_points(0, bits, lib.waveform.TimeAxis(len(bits), 1, first),
+                                            -(-self._window[1] // columns), prefix, numpy.asarray)
+        # Tricky as steps are unidirectional in mpl, the last value is repeated at the last sample (see _values_line)
+        axes[0].lines[0].set_data(numpy.append(t_ax, t[-1]), numpy.append(values_ax, bits[-1]))
+        for idx, (ax, wave) in enumerate(zip(axes[1:], waves)):
+            ax.lines[0].set_data(*self._line_points(idx + 1, wave, t, -(-self._window[1] * steps // columns),
+                                                    prefix * steps, lib.waveform.as_float))
+
+    def update(self, values, t, waves, fit=True):
+        """
+        Show the waveform plots
+        :param values: actual code to modulate (see plot_waveforms)
+        :param t: time array or lib.waveform.TimeAxis
+        :param waves: list of (wave array, PyPlot format code, label) to plot below the values
+        :param fit: True to fit the axes to the waves, False to keep them while the waves fit in (e.g. while the input
+                    is typed), see plot_waveforms
+        """
+        labels = tuple(label for wave, fmt, label in waves)
+        rebuild = redraw = labels != self._labels
+        if rebuild:
+            _draw_waveforms(self.figure, values, t, waves)
+            for artist in self._animated():
+                artist.set_animated(True)
+            self._labels, self._window, self._lines = labels, (_first_cycle(t), len(values)), None
+        steps = int(len(t) / len(values))
+        window = self._shown(_first_cycle(t), len(values), fit)
+        if window != self._window:
+            # The axes change, so the background has to be redrawn
+            self._set_window(window)
+            redraw = True
+        if fit:
+            # All points are calculated again
+            self._lines = None
+            if not rebuild:
+                axes = self.figure.axes
+                axes[0].set_title(_title(values))
+                axes[0].lines[0].set_data(*_values_line(values, t, steps))
+                for ax, (wave, fmt, label) in zip(axes[1:], waves):
+                    ax.lines[0].set_data(*_wave_line(self.figure, t, wave))
+        else:
+            self._set_lines(values, t, waves, steps)
+        if redraw:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        for artist in self._animated():
+            self.figure.draw_artist(artist)
+        self.canvas.blit(self.figure.bbox)
+
+
+def plot_waveforms(values, t, am=None, fm=None, pm=None, target="show", filename=None, canvas=None, fit=True):
+    """
+    Show or save waveform plots
+    Saving to a file does not use PyPlot, it can be done from several threads at once.
+    :param values: actual code to modulate (bytes of bit values, see lib.encoder, or sequence of "0" and "1")
+    :param t: time array or lib.waveform.TimeAxis
+    :param am: wave array for amplitude modulation, None to leave it out
+    :param fm: wave array for frequency modulation, None to leave it out
+    :param pm: wave array for phase modulation, None to leave it out
+    (wave arrays of integer dtype are scaled back to -1.0 .. 1.0, see lib.waveform.as_float)
+    :param target: "show" - display the plot, "file" - save the plot to the given file,
+                   "canvas" - update the plot of the given canvas
+    :param filename: file name to save the plot to, if target is "file"
+    :param canvas: PlotCanvas to update, if target is "canvas"
+    :param fit: True to fit the axes of the canvas to the waves, False to widen them in steps only, so that waves which
+                grow by few bits (e.g. a preview of the input while it is typed) are only blitted onto the canvas
+    :raise RuntimeError: target and/or filename or canvas mismatch
+    """
+    waves = [(wave, fmt, label) for wave, fmt, label in ((am, "g-", "AM"),
+                                                         (fm, "r-", "FM"),
+                                                         (pm, "c-", "PM")) if wave is not None]
     if target == "show":
+        # The interactive backend is only loaded if needed
+        import matplotlib.pyplot as plt
+        fig = plt.figure(num=_FIGURE, figsize=(16, 8))
+        _draw_waveforms(fig, values, t, waves)
         plt.show()
     elif target == "file" and filename is not None:
-        plt.savefig(filename)
+        fig = _file_figure()
+        try:
+            _draw_waveforms(fig, values, t, waves)
+            fig.savefig(filename)
+        finally:
+            # The figure does not hold the waves until the next chart
+            _clear_figure(fig)
+    elif target == "canvas" and canvas is not None:
+        canvas.update(values, t, waves, fit)
     else:
         logging.log(logging.ERROR, "Could not reach target {}.".format(target))
         raise RuntimeError("Invalid target.")
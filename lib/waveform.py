@@ -21,133 +21,1033 @@ Calculate Waveforms for AM, FM and PM modulation of binary codes
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import array
+import concurrent.futures
+import functools
+import itertools
 import logging
 import math
+import os
+import sys
 
 try:
     import numpy
     slow = False
 except ImportError:
-    # The numpy implementation only takes 9 % of time in comparison with the native implementation
-    # (sample size = 8000 bit)
+    # The numpy implementation only takes 12 % of time in comparison with the native implementation
+    # (sample size = 8000 bit). The native waves are assembled from templates about as fast as with numpy, nearly all
+    # of the time is spent on the time array (see implicit_time).
     logging.log(logging.WARN, "Could not load numpy. Calculations will be astonishingly slow.")
     slow = True
 
+# Modulation schemes
+SCHEMES = ("am", "fm", "pm")
 
-def _waveforms_numpy(code, steps):
+# Number of bits calculated at once when generating waveforms block by block
+_CHUNK_BITS = 1024
+
+# Header and footer of saved waveform files
+_HEADER = "t [cycle] AM          FM          PM"
+_FOOTER = "Created with Waveform Modulator, (c) 2020 Konstantin Köhring (@galaxy102), MIT license"
+
+# File formats supported by save
+# txt: text table of t, am, fm and pm
+# npy, npz: NumPy array files (npy as one table like txt, npz as compressed arrays t, am, fm and pm)
+# f32, i16: raw little-endian samples (am, fm and pm interleaved, time implied by steps) as float32 resp. int16
+FORMATS = ("txt", "npy", "npz", "f32", "i16")
+
+# Scale of the int16 raw format (amplitude 1.0 is mapped to full range)
+_INT16_SCALE = 32767
+
+
+class TimeAxis:
+    """
+    Time array of a waveform, calculated on demand from the sample index (t[i] == i / steps)
+    Supports len(), indexing, slicing (returning arrays) and conversion with numpy.asarray.
+    """
+    __slots__ = ("length", "steps", "offset")
+
+    def __init__(self, length, steps, offset=0):
+        """
+        Create the time axis
+        :param length: number of samples
+        :param steps: steps per interval
+        :param offset: index of the first sample, if the waveform is a part of a longer waveform
+        """
+        self.length = length
+        self.steps = steps
+        self.offset = offset
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        indices = range(self.offset, self.offset + self.length)[key]
+        if isinstance(key, slice):
+            if slow:
+                return [idx / self.steps for idx in indices]
+            return numpy.arange(indices.start, indices.stop, indices.step) / self.steps
+        return indices / self.steps
+
+    def __iter__(self):
+        return (idx / self.steps for idx in range(self.offset, self.offset + self.length))
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:].astype(dtype, copy=False) if dtype is not None else self[:]
+
+
+def _bits_numpy(code):
+    """
+    Convert a code into an array of bits
+    :param code: code to convert (bytes or array of bit values, see lib.encoder, or sequence of "0" and "1")
+    :return: numpy array of bits (dtype uint8)
+    :raise ValueError: the code holds other values than 0 and 1 (e.g. bytes of the characters "0" and "1")
+    """
+    if isinstance(code, numpy.ndarray):
+        bits = code.astype(numpy.uint8, copy=False)
+    elif isinstance(code, (bytes, bytearray, memoryview)):
+        # Already bit values, no copy needed
+        bits = numpy.frombuffer(code, dtype=numpy.uint8)
+    else:
+        bits = numpy.frombuffer("".join(code).encode("ascii"), dtype=numpy.uint8) - ord("0")
+    # The templates are gathered without bounds check, so other values must not get through
+    if bits.size and bits.max() > 1:
+        logging.log(logging.ERROR, "Could not modulate code with bit value {}.".format(bits.max()))
+        raise ValueError("Invalid code.")
+    return bits
+
+
+def _phase_numpy(bits, phase=None):
+    """
+    Calculate the phase state (0 or 1) of each interval for phase modulation
+    :param bits: numpy array of bits
+    :param phase: phase state of the interval preceding the bits, None if the bits start the code
+    :return: numpy array of phase states (dtype uint8)
+    """
+    # A LOW cycle toggles the phase, except for the very first cycle. The phase state of an interval therefore is the
+    # cumulative XOR (== parity) of the inverted bits up to and including this interval.
+    toggles = bits ^ 1
+    if len(toggles):
+        toggles[0] = 0 if phase is None else toggles[0] ^ phase
+    return numpy.bitwise_xor.accumulate(toggles)
+
+
+def _phase_after(code, phase=None):
+    """
+    Calculate the phase state of the last interval of a code
+    :param code: code to modulate
+    :param phase: phase state of the interval preceding the code, None if this is the start of the code
+    :return: phase state (0 or 1) of the last interval
+    """
+    lows = len(code) - (int(numpy.count_nonzero(_bits_numpy(code))) if not slow else sum(int(val) for val in code))
+    if phase is None:
+        # The very first interval never shifts the phase
+        phase = 0
+        if len(code) and not int(code[0]):
+            lows -= 1
+    return (phase + lows) % 2
+
+
+@functools.lru_cache(maxsize=None)
+def _templates_numpy(steps, dtype=None):
+    """
+    Calculate the waveform templates for one interval
+    The templates are cached per steps and dtype, so they are shared by all waveforms of a process.
+    :param steps: steps per interval to calculate
+    :param dtype: sample data type, integer types are scaled to full range (default: float64)
+    :return: tuple of read-only am, fm and pm template arrays, each indexed by the bit (or phase state) of the interval
+    """
+    # Base sine curves
+    t_i = numpy.arange(steps) * (1 / steps)
+    sin_t = numpy.sin(t_i * 2 * numpy.pi)
+    sin_2t = numpy.sin(2 * t_i * 2 * numpy.pi)
+    # AM value is calculated by multiplying the value (shifted to specified levels, here 1 or 2) with the sine curve
+    # and then normalizing the result
+    am_templates = numpy.stack(((0 + 1) / 2 * sin_t, (1 + 1) / 2 * sin_t))
+    # FM value is calculated by doubling the sine curve's frequency if the value is HIGH
+    fm_templates = numpy.stack((sin_t, sin_2t))
+    # PM value is calculated by phase shifting the curve by 180° (== multiplying the curve with -1) if value is 0
+    pm_templates = numpy.stack((sin_t, -1 * sin_t))
+    templates = (am_templates, fm_templates, pm_templates)
+    dtype = numpy.dtype(dtype)
+    if dtype.kind in "iu":
+        templates = tuple(numpy.rint(tpl * numpy.iinfo(dtype).max).astype(dtype) for tpl in templates)
+    else:
+        templates = tuple(tpl.astype(dtype, copy=False) for tpl in templates)
+    for tpl in templates:
+        tpl.flags.writeable = False
+    return templates
+
+
+def _synthesize_numpy(bits, phases, offset, templates, out):
+    """
+    Write the waveforms for given bits into given arrays
+    :param bits: numpy array of bits
+    :param phases: numpy array of phase states for these bits (see _phase_numpy)
+    :param offset: index of the first interval, if the bits are a part of a longer code
+    :param templates: tuple of am, fm and pm templates (see _templates_numpy)
+    :param out: tuple of time, am, fm and pm arrays to write to (contiguous, steps * len(bits) samples each)
+                Arrays which are None (or a TimeAxis) are skipped, phases is only needed for pm.
+    """
+    am_templates, fm_templates, pm_templates = templates
+    steps = am_templates.shape[1]
+    t, am, fm, pm = out
+    if t is not None and not isinstance(t, TimeAxis) and t.dtype == numpy.float64:
+        # The sample indices (exact in float64) are assembled in place from one row per interval, so no temporary array
+        # of all samples is needed
+        numpy.add(numpy.arange(offset, offset + len(bits))[:, numpy.newaxis] * steps, numpy.arange(steps),
+                  out=t.reshape(len(bits), steps))
+        numpy.divide(t, steps, out=t)
+    elif t is not None and not isinstance(t, TimeAxis):
+        # Lower precision could not hold the sample indices, only the time is converted
+        numpy.divide(numpy.arange(offset * steps, (offset + len(bits)) * steps), steps, out=t)
+    # Gather one template per interval into an (intervals, steps) view of the output. The indices are 0 or 1, so they
+    # need no bounds check (mode "raise" would gather into a temporary copy of the output first).
+    if am is not None:
+        am_templates.take(bits, axis=0, out=am.reshape(len(bits), steps), mode="clip")
+    if fm is not None:
+        fm_templates.take(bits, axis=0, out=fm.reshape(len(bits), steps), mode="clip")
+    if pm is not None:
+        pm_templates.take(phases, axis=0, out=pm.reshape(len(bits), steps), mode="clip")
+
+
+def _time_numpy(intervals, steps, offset=0, implicit_time=False):
+    """
+    Allocate the time array of a waveform
+    :param intervals: number of intervals
+    :param steps: steps per interval
+    :param offset: index of the first interval, if the waveform is a part of a longer waveform
+    :param implicit_time: True to create a TimeAxis instead of an array
+    :return: empty time array or TimeAxis
+    """
+    if implicit_time:
+        return TimeAxis(intervals * steps, steps, offset * steps)
+    return numpy.empty(intervals * steps)
+
+
+def _buffer_numpy(buffer, samples, dtype=None):
+    """
+    Get the array to write the samples of a waveform to
+    :param buffer: numpy array to write to (the first samples are used), None to allocate the array
+    :param samples: number of samples
+    :param dtype: sample data type of the waveform
+    :return: array of the given number of samples
+    :raise ValueError: the buffer is too small or of another dtype
+    """
+    if buffer is None:
+        return numpy.empty(samples, dtype=dtype)
+    if len(buffer) < samples or buffer.dtype != numpy.dtype(dtype):
+        logging.log(logging.ERROR, "Could not write {} samples of {} to a buffer of {} samples of {}."
+                    .format(samples, numpy.dtype(dtype), len(buffer), buffer.dtype))
+        raise ValueError("Output buffer does not match.")
+    return buffer[:samples]
+
+
+def _waveforms_numpy(code, steps, offset=0, phase=None, dtype=None, implicit_time=False, out=None, workers=1):
     """
     Calculate the waveforms for a given binary code using numpy
     :param code: code to modulate
     :param steps: steps per interval to calculate
+    :param offset: index of the first interval, if the code is a part of a longer code
+    :param phase: phase state of the interval preceding the code, None if this is the start of the code
+    :param dtype: sample data type of the waves (see _templates_numpy)
+    :param implicit_time: True to return a TimeAxis instead of the time array
+    :param out: tuple of time, am, fm and pm arrays to write to instead of allocating them (see waveforms)
+    :param workers: number of threads to use (see _fill_numpy)
     :return: tuple of time, am, fm and pm arrays
     """
     logging.log(logging.DEBUG,
-                "Using NumPy to calculate waveforms for {} using {} steps per interval.".format("".join(code), steps))
-    t = numpy.arange(0, len(code), 1 / steps)
+                "Using NumPy to calculate waveforms for {} bits using {} steps per interval.".format(len(code), steps))
+    bits = _bits_numpy(code)
+    buffers = out or (None,) * 4
+    if implicit_time:
+        t = _time_numpy(len(bits), steps, offset, implicit_time)
+    else:
+        t = _buffer_numpy(buffers[0], len(bits) * steps, numpy.float64)
+    out = (t,) + tuple(_buffer_numpy(buffer, len(bits) * steps, dtype) for buffer in buffers[1:])
+    _fill_numpy(bits, steps, out, workers, offset, phase)
+    return out
+
+
+def _fill_numpy(bits, steps, out, workers=1, offset=0, phase=None, progress=None):
+    """
+    Write the waveforms for given bits into given arrays chunk by chunk
+    :param bits: numpy array of bits
+    :param steps: steps per interval to calculate
+    :param out: tuple of time, am, fm and pm arrays to write to (steps * len(bits) samples each)
+                Arrays which are None (or a TimeAxis) are skipped.
+    :param workers: number of threads to use
+    :param offset: index of the first interval, if the bits are a part of a longer code
+    :param phase: phase state of the interval preceding the bits, None if the bits start the code
+    :param progress: function to call with the number of written and total bits after each chunk (see waveforms)
+    """
+    # The phase states are the only serial dependency, but scanning them only takes one pass over the bits
+    phases = _phase_numpy(bits, phase) if out[3] is not None else None
+    templates = _templates_numpy(steps, next((wave.dtype for wave in out[1:] if wave is not None), None))
+
+    def synthesize_chunk(idx_low):
+        idx_high = idx_low + _CHUNK_BITS
+        _synthesize_numpy(bits[idx_low:idx_high], None if phases is None else phases[idx_low:idx_high],
+                          offset + idx_low, templates, tuple(wave if wave is None or isinstance(wave, TimeAxis)
+                                           else wave[idx_low * steps:idx_high * steps] for wave in out))
+        return min(idx_high, len(bits))
+
+    chunks = range(0, len(bits), _CHUNK_BITS)
+    if workers > 1 and len(chunks) > 1:
+        # NumPy releases the GIL while gathering the templates, so threads can fill the shared arrays concurrently
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            # Consume the results to propagate exceptions
+            for idx_high in pool.map(synthesize_chunk, chunks):
+                if progress is not None:
+                    progress(idx_high, len(bits))
+    else:
+        for idx_low in chunks:
+            idx_high = synthesize_chunk(idx_low)
+            if progress is not None:
+                progress(idx_high, len(bits))
+
+
+def _patch_numpy(old_bits, new_bits, steps, out, phase=None):
+    """
+    Rewrite the waveforms of a code in place to those of another code of the same length
+    :param old_bits: numpy array of bits of the waveforms
+    :param new_bits: numpy array of bits to rewrite the waveforms to
+    :param steps: steps per interval
+    :param out: tuple of time, am, fm and pm arrays to rewrite (steps * len(bits) samples each)
+                Arrays which are None (or a TimeAxis) are skipped, the time is never changed.
+    :param phase: phase state of the interval preceding the bits, None if the bits start the code
+    :return: number of changed bits
+    """
+    changed = old_bits != new_bits
+    idx = numpy.flatnonzero(changed)
+    if not len(idx):
+        return 0
+    for tpl_idx, wave in enumerate(out[1:]):
+        if wave is None or isinstance(wave, TimeAxis):
+            continue
+        # One row per interval (a view, the waves are contiguous)
+        intervals = wave.reshape(-1, steps)
+        if SCHEMES[tpl_idx] == "pm":
+            # Each changed bit toggles the phase of its own and all following intervals, except for the very first bit
+            # of the code (see _phase_numpy). PM templates only differ in sign, so the affected intervals are negated.
+            toggles = changed.copy()
+            if phase is None:
+                toggles[0] = False
+            flipped = numpy.logical_xor.accumulate(toggles)[:, numpy.newaxis]
+            first = idx[1] if not toggles[idx[0]] and len(idx) > 1 else idx[0]
+            numpy.negative(intervals[first:], out=intervals[first:], where=flipped[first:])
+        else:
+            intervals[idx] = _templates_numpy(steps, wave.dtype)[tpl_idx][new_bits[idx]]
+    return len(idx)
+
+
+@functools.lru_cache(maxsize=None)
+def _templates_native(steps):
+    """
+    Calculate the waveform templates for one interval using Plain Python
+    The templates are cached per steps, they must not be modified.
+    :param steps: steps per interval to calculate
+    :return: dictionary of am, fm and pm template arrays, each indexed by the bit (or phase state) of the interval
+    """
     # Base sine curves
-    sin_t = numpy.sin(t[:steps] * 2 * numpy.pi)
-    sin_2t = numpy.sin(2 * t[:steps] * 2 * numpy.pi)
-    # Amplitude Modulation
-    am = numpy.empty_like(t)
-    # Frequency Modulation
-    fm = numpy.empty_like(t)
-    # Phase Modulation
-    pm = numpy.empty_like(t)
-    phase_shift = False  # Initial shift
-    for idx, val in enumerate(code):
-        # Lower and Upper boundaries for this cycle's calculation
-        # (attention: lower boundary inclusive, upper boundary exclusive)
-        idx_low = idx * steps
-        idx_high = (idx + 1) * steps
-        # AM value is calculated by multiplying the value (shifted to specified levels, here 1 or 2) with the sine curve
-        # and then normalizing the result
-        am[idx_low:idx_high] = (int(val) + 1) / 2 * sin_t[:steps]
+    sin_t = array.array("d", (math.sin(idx * (1 / steps) * 2 * math.pi) for idx in range(steps)))
+    sin_2t = array.array("d", (math.sin(2 * (idx * (1 / steps)) * 2 * math.pi) for idx in range(steps)))
+    return {
+        # AM value is calculated by multiplying the value (shifted to specified levels, here 1 or 2) with the sine
+        # curve and then normalizing the result
+        "am": (array.array("d", ((0 + 1) / 2 * val for val in sin_t)),
+               array.array("d", ((1 + 1) / 2 * val for val in sin_t))),
         # FM value is calculated by doubling the sine curve's frequency if the value is HIGH
-        fm[idx_low:idx_high] = sin_2t[:steps] if int(val) else sin_t[:steps]
+        "fm": (sin_t, sin_2t),
         # PM value is calculated by phase shifting the curve by 180° (== multiplying the curve with -1) if value is 0
-        if idx > 0:
+        "pm": (sin_t, array.array("d", (-1 * val for val in sin_t))),
+    }
+
+
+def _phases_native(code, phase=None):
+    """
+    Calculate the phase state (0 or 1) of each interval for phase modulation using Plain Python
+    :param code: code to modulate
+    :param phase: phase state of the interval preceding the code, None if this is the start of the code
+    :return: generator of phase states
+    """
+    # The very first interval never shifts the phase
+    shift = phase is not None
+    phase = phase or 0
+    for val in code:
+        if shift:
             # Phase shift if val == 0
-            phase_shift = phase_shift ^ (not bool(int(val)))
-        factor = -1 if phase_shift else 1
-        pm[idx_low:idx_high] = factor * sin_t[:steps]
-    return t, am, fm, pm
+            phase ^= 1 - int(val)
+        shift = True
+        yield phase
 
 
-def _waveforms_native(code, steps):
+def _time_native(t, progress=None):
+    """
+    Calculate the time array using Plain Python
+    :param t: TimeAxis of the waveform
+    :param progress: function to call with the number of calculated and total bits after each chunk (see waveforms)
+    :return: time array (array of doubles)
+    """
+    bits = len(t) // t.steps
+    time = array.array("d")
+    for idx_low in range(0, bits, _CHUNK_BITS):
+        time.extend(t[idx_low * t.steps:(idx_low + _CHUNK_BITS) * t.steps])
+        if progress is not None:
+            progress(min(idx_low + _CHUNK_BITS, bits), bits)
+    return time
+
+
+def _wave_native(code, steps, scheme, phase=None, templates=None, progress=None):
+    """
+    Calculate a single waveform for a given binary code using Plain Python
+    :param code: code to modulate
+    :param steps: steps per interval to calculate
+    :param scheme: one of SCHEMES
+    :param phase: phase state of the interval preceding the code, None if this is the start of the code
+    :param templates: templates to use (see _templates_native)
+    :param progress: function to call with the number of calculated and total bits after each chunk (see waveforms)
+    :return: wave array (array of doubles)
+    """
+    if templates is None:
+        templates = _templates_native(steps)
+    zero, one = templates[scheme]
+    keys = _phases_native(code, phase) if scheme == "pm" else map(int, code)
+    # Assemble the wave by appending one template per interval, which copies whole blocks instead of single samples
+    wave = array.array("d")
+    for idx_low in range(0, len(code), _CHUNK_BITS):
+        for key in itertools.islice(keys, _CHUNK_BITS):
+            wave.extend(one if key else zero)
+        if progress is not None:
+            progress(min(idx_low + _CHUNK_BITS, len(code)), len(code))
+    return wave
+
+
+def _waveforms_native(code, steps, offset=0, phase=None, implicit_time=False):
     """
     Calculate the waveforms for a given binary code using Plain Python
     :param code: code to modulate
     :param steps: steps per interval to calculate
+    :param offset: index of the first interval, if the code is a part of a longer code
+    :param phase: phase state of the interval preceding the code, None if this is the start of the code
+    :param implicit_time: True to return a TimeAxis instead of the time array
     :return: tuple of time, am, fm and pm arrays
     """
     logging.log(logging.DEBUG,
-                "Using Python to calculate waveforms for {} using {} steps per interval.".format("".join(code), steps))
-    # Time array
-    # Pre-allocation, see https://stackoverflow.com/a/521688
-    t = [0.0] * (steps * len(code))
-    step_width = 1 / steps
-    for idx in range(1, len(t)):
-        t[idx] = t[idx - 1] + step_width
-    # Base sine curves
-    sin_t = [0.0] * steps
-    sin_2t = [0.0] * steps
-    for idx, t_i in enumerate(t[:steps]):
-        sin_t[idx] = math.sin(t_i * 2 * math.pi)
-        sin_2t[idx] = math.sin(2 * t_i * 2 * math.pi)
-    # Amplitude Modulation
-    am = [0.0] * len(t)
-    # Frequency Modulation
-    fm = [0.0] * len(t)
-    # Phase Modulation
-    pm = [0.0] * len(t)
-    phase_shift = False  # Initial shift
-    for idx, val in enumerate(code):
-        # Lower and Upper boundaries for this cycle's calculation
-        # (attention: lower boundary inclusive, upper boundary exclusive)
-        idx_low = idx * steps
-        idx_high = (idx + 1) * steps
-        for i in range(idx_low, idx_high):
-            # AM value is calculated by multiplying the value (shifted to specified levels, here 1 or 2) with the sine curve
-            # and then normalizing the result
-            am[i] = (int(val) + 1) / 2 * sin_t[i % steps]
-            # FM value is calculated by doubling the sine curve's frequency if the value is HIGH
-            fm[i] = sin_2t[i % steps] if int(val) else sin_t[i % steps]
-            # PM value is calculated by phase shifting the curve by 180° (== multiplying the curve with -1) if value is 0
-            if idx > 0:
-                # Phase shift if val == 0
-                phase_shift = phase_shift ^ (not bool(int(val)))
-            factor = -1 if phase_shift else 1
-            pm[i] = factor * sin_t[i % steps]
-    return t, am, fm, pm
-
-
-def waveforms(code, steps=200):
+                "Using Python to calculate waveforms for {} bits using {} steps per interval.".format(len(code), steps))
+    t = TimeAxis(steps * len(code), steps, offset * steps)
+    if not implicit_time:
+        t = array.array("d", t)
+    templates = _templates_native(steps)
+    return (t,) + tuple(_wave_native(code, steps, scheme, phase, templates) for scheme in SCHEMES)
+
+
+def _patch_native(old_code, new_code, steps, out, phase=None):
+    """
+    Rewrite the waveforms of a code in place to those of another code of the same length using Plain Python
+    :param old_code: code of the waveforms
+    :param new_code: code to rewrite the waveforms to
+    :param steps: steps per interval
+    :param out: tuple of time, am, fm and pm arrays to rewrite (see _patch_numpy)
+    :param phase: phase state of the interval preceding the code, None if this is the start of the code
+    :return: number of changed bits
+    """
+    changed = [idx for idx in range(len(new_code)) if int(old_code[idx]) != int(new_code[idx])]
+    templates = _templates_native(steps)
+    for scheme, wave in zip(SCHEMES, out[1:]):
+        if wave is None or isinstance(wave, TimeAxis) or not changed:
+            continue
+        if scheme == "pm":
+            # The phase of all intervals following a changed bit may change (see _patch_numpy), they are rewritten
+            first = next((idx for idx in changed if idx or phase is not None), None)
+            if first is not None:
+                preceding = _phase_after(new_code[:first], phase) if first else phase
+                wave[first * steps:] = _wave_native(new_code[first:], steps, scheme, preceding, templates)
+        else:
+            zero, one = templates[scheme]
+            for idx in changed:
+                wave[idx * steps:(idx + 1) * steps] = one if int(new_code[idx]) else zero
+    return len(changed)
+
+
+class WaveformSet:
+    """
+    Waveforms for a given binary code, each modulation is calculated (and cached) on first access
+    Unpacks like the tuple (t, am, fm, pm), which calculates all of them.
+    """
+    __slots__ = ("steps", "workers", "dtype", "implicit_time", "progress", "offset", "_phase", "_out", "_code", "_bits",
+                 "_t", "_am", "_fm", "_pm")
+
+    def __init__(self, code, steps=200, workers=1, dtype=None, implicit_time=False, progress=None, offset=0,
+                 phase=None, out=None):
+        """
+        Prepare the waveforms, see waveforms for the parameters
+        :param offset: index of the first interval, if the code is a part of a longer code
+        :param phase: phase state of the interval preceding the code, None if this is the start of the code
+        """
+        self.steps = steps
+        self.workers = workers
+        self.dtype = dtype
+        self.implicit_time = implicit_time
+        self.progress = progress
+        self.offset = offset
+        self._phase = phase
+        self._out = out or (None,) * 4
+        self._code = code
+        self._bits = None if slow else _bits_numpy(code)
+        self._t = self._am = self._fm = self._pm = None
+
+    def _calculate(self, scheme):
+        """
+        Calculate a single waveform
+        :param scheme: "t" or one of SCHEMES
+        :return: array of the waveform
+        """
+        if slow:
+            logging.log(logging.DEBUG, "Using Python to calculate {} for {} bits using {} steps per interval."
+                        .format(scheme, len(self._code), self.steps))
+            if scheme == "t":
+                t = TimeAxis(len(self._code) * self.steps, self.steps, self.offset * self.steps)
+                return t if self.implicit_time else _time_native(t, self.progress)
+            return _wave_native(self._code, self.steps, scheme, self._phase, progress=self.progress)
+        logging.log(logging.DEBUG, "Using NumPy on {} thread(s) to calculate {} for {} bits using {} steps per interval."
+                    .format(self.workers, scheme, len(self._bits), self.steps))
+        out = [None] * 4
+        idx = (("t",) + SCHEMES).index(scheme)
+        if scheme == "t" and self.implicit_time:
+            out[0] = _time_numpy(len(self._bits), self.steps, self.offset, self.implicit_time)
+        else:
+            out[idx] = _buffer_numpy(self._out[idx], len(self._bits) * self.steps,
+                                     numpy.float64 if scheme == "t" else self.dtype)
+        _fill_numpy(self._bits, self.steps, out, self.workers, self.offset, self._phase, self.progress)
+        return next(wave for wave in out if wave is not None)
+
+    @property
+    def t(self):
+        """
+        Time array (or TimeAxis)
+        """
+        if self._t is None:
+            self._t = self._calculate("t")
+        return self._t
+
+    @property
+    def am(self):
+        """
+        Wave array for amplitude modulation
+        """
+        if self._am is None:
+            self._am = self._calculate("am")
+        return self._am
+
+    @property
+    def fm(self):
+        """
+        Wave array for frequency modulation
+        """
+        if self._fm is None:
+            self._fm = self._calculate("fm")
+        return self._fm
+
+    @property
+    def pm(self):
+        """
+        Wave array for phase modulation
+        """
+        if self._pm is None:
+            self._pm = self._calculate("pm")
+        return self._pm
+
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        return iter((self.t, self.am, self.fm, self.pm))
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return tuple(self)[idx]
+        return getattr(self, (("t",) + SCHEMES)[idx])
+
+
+def _common_prefix(old, new):
+    """
+    Get the length of the common prefix of two codes
+    :param old: first code
+    :param new: second code
+    :return: number of leading bits which are equal in both codes
+    """
+    length = min(len(old), len(new))
+    if slow:
+        return next((idx for idx in range(length) if int(old[idx]) != int(new[idx])), length)
+    diff = numpy.flatnonzero(_bits_numpy(old[:length]) != _bits_numpy(new[:length]))
+    return int(diff[0]) if len(diff) else length
+
+
+class WaveformStream:
+    """
+    Waveforms of a code which grows at its end, e.g. bits received continuously or an input while it is typed
+    Only appended bits are calculated, the phase state for phase modulation is carried over. The wave buffers double
+    their capacity when they are full, so appending takes amortized O(appended bits) instead of recalculating the
+    waveforms of the whole code. The time is given as TimeAxis.
+    """
+    __slots__ = ("steps", "schemes", "dtype", "_bits", "_phase", "_waves")
+
+    def __init__(self, steps=200, schemes=SCHEMES, dtype=None):
+        """
+        Prepare empty waveforms
+        :param steps: steps per interval to calculate
+        :param schemes: modulation schemes to calculate (see SCHEMES)
+        :param dtype: sample data type of the waves (see waveforms), only used with numpy
+        """
+        self.steps = steps
+        self.schemes = tuple(schemes)
+        self.dtype = dtype
+        # Bit values of the code, one byte per bit
+        self._bits = bytearray()
+        # Phase state of the last interval, None if the code is empty
+        self._phase = None
+        # Wave buffers, the first len(self) * steps samples are valid (with numpy, else the buffers are exact)
+        self._waves = {scheme: array.array("d") if slow else numpy.empty(0, dtype=dtype) for scheme in self.schemes}
+
+    def __len__(self):
+        return len(self._bits)
+
+    def _reserve(self, bits):
+        """
+        Grow the wave buffers to hold at least the given number of bits, at least doubling their capacity
+        :param bits: number of bits to hold
+        """
+        for scheme, wave in self._waves.items():
+            if len(wave) < bits * self.steps:
+                grown = numpy.empty(max(bits * self.steps, 2 * len(wave)), dtype=self.dtype)
+                grown[:len(self._bits) * self.steps] = wave[:len(self._bits) * self.steps]
+                self._waves[scheme] = grown
+
+    def append(self, bits):
+        """
+        Append bits to the code and calculate their samples
+        :param bits: bits to append (bytes or array of bit values, see lib.encoder, or sequence of "0" and "1")
+        """
+        if not len(bits):
+            return
+        offset = len(self._bits)
+        if slow:
+            templates = _templates_native(self.steps)
+            for scheme, wave in self._waves.items():
+                wave.extend(_wave_native(bits, self.steps, scheme, self._phase, templates))
+            self._bits.extend(int(val) for val in bits)
+        else:
+            bits = _bits_numpy(bits)
+            self._reserve(offset + len(bits))
+            out = [None] * 4
+            for scheme, wave in self._waves.items():
+                out[1 + SCHEMES.index(scheme)] = wave[offset * self.steps:(offset + len(bits)) * self.steps]
+            _fill_numpy(bits, self.steps, out, offset=offset, phase=self._phase)
+            self._bits.extend(bits.tobytes())
+        self._phase = _phase_after(bits, self._phase)
+
+    def truncate(self, bits):
+        """
+        Drop the end of the code and its samples
+        :param bits: number of bits to keep
+        """
+        del self._bits[bits:]
+        self._phase = _phase_after(self._bits) if self._bits else None
+        if slow:
+            for wave in self._waves.values():
+                del wave[len(self._bits) * self.steps:]
+
+    def edit(self, code):
+        """
+        Change the code, only the bits following the common prefix of the old and the new code are calculated
+        (a code of the same length is patched instead, see update)
+        :param code: new code (bytes or array of bit values, see lib.encoder, or sequence of "0" and "1")
+        :return: number of calculated (or patched) bits
+        """
+        if len(code) == len(self._bits):
+            # Changed bits are patched in place
+            out = self.view()
+            changed = _patch_native(self._bits, code, self.steps, out) if slow else \
+                _patch_numpy(_bits_numpy(self._bits), _bits_numpy(code), self.steps, out)
+            self._bits[:] = bytes(int(val) for val in code) if slow else _bits_numpy(code).tobytes()
+            self._phase = _phase_after(self._bits) if self._bits else None
+            return changed
+        prefix = _common_prefix(self._bits, code)
+        self.truncate(prefix)
+        self.append(code[prefix:])
+        return len(code) - prefix
+
+    @property
+    def code(self):
+        """
+        Code of the waveforms (bytes of bit values)
+        """
+        return bytes(self._bits)
+
+    def view(self):
+        """
+        Get the current waveforms without copying them
+        With numpy, the waves are views of the buffers. They are not updated by later changes which grow the buffers,
+        and later changes of the same samples (after truncate) show in them. Without numpy, the buffers are returned.
+        :return: tuple of TimeAxis, am, fm and pm arrays (None for the schemes which are not calculated)
+        """
+        length = len(self._bits) * self.steps
+        waves = self._waves if slow else {scheme: wave[:length] for scheme, wave in self._waves.items()}
+        return (TimeAxis(length, self.steps),) + tuple(waves.get(scheme) for scheme in SCHEMES)
+
+
+class VirtualWaveform:
+    """
+    Waveform of a code, synthesized on demand from the sample index like TimeAxis
+    Only the key of each interval (the bit for AM and FM, the phase state for PM) is stored, packed to one bit per
+    interval, so a sample is calculated from its interval's key and the templates in O(1). This allows inspecting and
+    slicing waveforms of billions of samples in a few megabytes. Supports len(), indexing, slicing (returning arrays),
+    iteration and conversion with numpy.asarray (which calculates the whole waveform).
+    """
+    __slots__ = ("scheme", "steps", "dtype", "length", "_keys", "_templates")
+
+    def __init__(self, code, scheme, steps=200, dtype=None):
+        """
+        Prepare the waveform
+        :param code: code to modulate (bytes or array of bit values, see lib.encoder, or sequence of "0" and "1")
+        :param scheme: one of SCHEMES
+        :param steps: steps per interval
+        :param dtype: sample data type (see waveforms), only used with numpy
+        :raise ValueError: unknown scheme
+        """
+        if scheme not in SCHEMES:
+            logging.log(logging.ERROR, "Unknown modulation scheme {}.".format(scheme))
+            raise ValueError("Unknown modulation scheme.")
+        self.scheme = scheme
+        self.steps = steps
+        self.dtype = dtype
+        self.length = len(code) * steps
+        if slow:
+            self._templates = _templates_native(steps)[scheme]
+            keys = _phases_native(code) if scheme == "pm" else map(int, code)
+            self._keys = bytearray()
+            for octet in iter(lambda: tuple(itertools.islice(keys, 8)), ()):
+                self._keys.append(sum(key << (7 - idx) for idx, key in enumerate(octet)))
+        else:
+            self._templates = _templates_numpy(steps, dtype)[SCHEMES.index(scheme)]
+            keys = _bits_numpy(code)
+            self._keys = numpy.packbits(_phase_numpy(keys) if scheme == "pm" else keys)
+
+    def __len__(self):
+        return self.length
+
+    def _sample(self, idx):
+        """
+        Calculate a single sample
+        :param idx: non-negative index of the sample
+        :return: sample value
+        """
+        interval, step = divmod(idx, self.steps)
+        return self._templates[(self._keys[interval >> 3] >> (7 - (interval & 7))) & 1][step]
+
+    def __getitem__(self, key):
+        indices = range(self.length)[key]
+        if isinstance(key, slice):
+            if slow:
+                return [self._sample(idx) for idx in indices]
+            idx = numpy.arange(indices.start, indices.stop, indices.step)
+            intervals, steps = numpy.divmod(idx, self.steps)
+            return self._templates[(self._keys[intervals >> 3] >> (7 - (intervals & 7))) & 1, steps]
+        return self._sample(indices)
+
+    def __iter__(self):
+        if slow:
+            return (self._sample(idx) for idx in range(self.length))
+        # Calculated in blocks, the samples are yielded one by one
+        chunk = _CHUNK_BITS * self.steps
+        return itertools.chain.from_iterable(self[idx:idx + chunk] for idx in range(0, self.length, chunk))
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:].astype(dtype, copy=False) if dtype is not None else self[:]
+
+
+def waveforms(code, steps=200, workers=1, dtype=None, implicit_time=False, progress=None, start_bit=None,
+              end_bit=None, out=None):
     """
     Calculate the waveforms for a given binary code
+    :param code: code to modulate (bytes or array of bit values, see lib.encoder, or sequence of "0" and "1")
+    :param steps: steps per interval to calculate
+    :param workers: number of threads to use (None for one per CPU), only used with numpy
+    :param dtype: sample data type of the waves, e.g. "float32" or "int8" (default: float64), only used with numpy
+                  Integer types are scaled to full range, see as_float. The time array always holds float64.
+    :param implicit_time: True to return a TimeAxis, which calculates the time on demand, instead of the time array
+    :param progress: function to call with the number of calculated and total bits after each chunk of a waveform
+                     (can be changed with the progress attribute), an exception raised by it aborts the calculation
+    :param start_bit: index of the first bit to calculate the waveforms of (default: 0, negative counts from the end)
+    :param end_bit: index following the last bit to calculate the waveforms of (default: end of the code)
+                    Only the samples of the bits in this window are calculated, the time starts at start_bit.
+    :param out: tuple of time, am, fm and pm arrays to write the waveforms to instead of allocating them, e.g. buffers
+                reused for many codes or in shared memory (only used with numpy, None entries are allocated)
+                The waveforms are views of the first steps * bits samples of these arrays, which must be of the
+                sample data type (float64 for the time) and at least as long.
+    :return: WaveformSet, which calculates each waveform on first access and unpacks to (t, am, fm, pm)
+    :raise ValueError: a buffer of out does not match (on access of the waveform)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if start_bit is None and end_bit is None:
+        return WaveformSet(code, steps, workers, dtype, implicit_time, progress, out=out)
+    start, end, _ = slice(start_bit, end_bit).indices(len(code))
+    # The phase state at the start of the window only depends on the number of LOW bits preceding it
+    phase = _phase_after(code[:start]) if start else None
+    logging.log(logging.DEBUG, "Calculating the waveforms of bits {} to {} of {} bits.".format(start, end, len(code)))
+    return WaveformSet(code[start:max(start, end)], steps, workers, dtype, implicit_time, progress, start, phase, out)
+
+
+def waveforms_iter(code, steps=200, chunk_bits=None, dtype=None, implicit_time=False, out=None, workers=1):
+    """
+    Calculate the waveforms for a given binary code block by block
+    The concatenated blocks equal the result of waveforms(code, steps, dtype=dtype).
     :param code: code to modulate
     :param steps: steps per interval to calculate
-    :return: tuple of time, am, fm and pm arrays
+    :param chunk_bits: number of bits to calculate per block (see waveforms_stream)
+    :param dtype: sample data type of the waves (see waveforms)
+    :param implicit_time: True to return a TimeAxis per block instead of the time array (see waveforms)
+    :param out: tuple of time, am, fm and pm arrays to write each block to (see waveforms_stream)
+    :param workers: number of threads to calculate each block with (see waveforms_stream)
+    :return: generator of tuples of time, am, fm and pm arrays
+    """
+    return waveforms_stream((code,), steps, chunk_bits, dtype, implicit_time, out, workers)
+
+
+def waveforms_stream(codes, steps=200, chunk_bits=None, dtype=None, implicit_time=False, out=None, workers=1):
+    """
+    Calculate the waveforms for a binary code given in parts (e.g. read from a file, see lib.encoder) block by block
+    The concatenated blocks equal the result of waveforms(code, steps, dtype=dtype) of the concatenated code.
+    :param codes: iterable of consecutive parts of the code to modulate
+    :param steps: steps per interval to calculate
+    :param chunk_bits: maximum number of bits to calculate per block (default: 1024 per worker)
+    :param dtype: sample data type of the waves (see waveforms)
+    :param implicit_time: True to return a TimeAxis per block instead of the time array (see waveforms)
+    :param out: tuple of time, am, fm and pm arrays of at least steps * chunk_bits samples to write each block to
+                instead of allocating it (see waveforms), each block is overwritten by the next one
+    :param workers: number of threads to calculate each block with (None for one per CPU), only used with numpy
+                    The threads share a block in parts of 1024 bits, so smaller blocks are calculated by one thread.
+    :return: generator of tuples of time, am, fm and pm arrays
+    :raise ValueError: a buffer of out does not match
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_bits is None:
+        chunk_bits = _CHUNK_BITS * workers
+    offset = 0
+    phase = None  # Phase state is carried from block to block
+    for code in codes:
+        for idx in range(0, len(code), chunk_bits):
+            chunk = code[idx:idx + chunk_bits]
+            if slow:
+                yield _waveforms_native(chunk, steps, offset, phase, implicit_time)
+            else:
+                yield _waveforms_numpy(chunk, steps, offset, phase, dtype, implicit_time, out, workers)
+            phase = _phase_after(chunk, phase)
+            offset += len(chunk)
+
+
+def update(waves, old_code, new_code):
+    """
+    Update the waveforms of a code in place to those of another code of the same length
+    Only the intervals of changed bits are rewritten for AM and FM, for PM the intervals following a changed bit are
+    negated. This is much faster than calculating the waveforms again for codes which differ in few bits.
+    :param waves: WaveformSet of old_code or tuple of time, am, fm and pm arrays of old_code
+                  (arrays which are None or a TimeAxis are skipped, waves of a WaveformSet which are not calculated yet
+                  are calculated for new_code on access)
+                  For a window of a longer code (see start_bit of waveforms), the codes are the bits of the window. The
+                  phase state at the window start is kept, so the bits preceding the window must not differ (calculate
+                  the window again otherwise).
+    :param old_code: code of the waveforms
+    :param new_code: code to update the waveforms to
+    :return: the given waves
+    :raise ValueError: the codes differ in length
+    """
+    if len(old_code) != len(new_code):
+        logging.log(logging.ERROR, "Could not update waveforms of {} bits to {} bits."
+                    .format(len(old_code), len(new_code)))
+        raise ValueError("Codes differ in length.")
+    if isinstance(waves, WaveformSet):
+        steps, out, phase = waves.steps, (None, waves._am, waves._fm, waves._pm), waves._phase
+        waves._code = new_code
+        waves._bits = None if slow else _bits_numpy(new_code)
+    else:
+        steps, out, phase = None, waves, None
+        if len(new_code):
+            steps = next(len(wave) for wave in waves if wave is not None) // len(new_code)
+    if not len(new_code):
+        return waves
+    if slow:
+        changed = _patch_native(old_code, new_code, steps, out, phase)
+    else:
+        changed = _patch_numpy(_bits_numpy(old_code), _bits_numpy(new_code), steps, out, phase)
+    logging.log(logging.DEBUG, "Updated waveforms of {} bits for {} changed bits.".format(len(new_code), changed))
+    return waves
+
+
+def as_float(wave):
+    """
+    Convert a wave array to floating point amplitudes
+    Waves calculated with an integer dtype are scaled to full range, they are scaled back to -1.0 .. 1.0.
+    :param wave: wave array
+    :return: wave array of floats (the given array if it already holds floats)
+    """
+    if slow:
+        return wave
+    wave = numpy.asarray(wave)
+    if wave.dtype.kind not in "iu":
+        return wave
+    return wave / numpy.iinfo(wave.dtype).max
+
+
+def _raw_bytes(waves, fmt):
+    """
+    Convert waveform arrays to raw little-endian interleaved samples
+    :param waves: tuple of waveform arrays (without time)
+    :param fmt: "f32" for float32, "i16" for int16 scaled to full range
+    :return: bytes of the samples
     """
     if slow:
-        return _waveforms_native(code, steps)
+        if fmt == "i16":
+            samples = array.array("h", (round(val * _INT16_SCALE) for row in zip(*waves) for val in row))
+        else:
+            samples = array.array("f", (val for row in zip(*waves) for val in row))
+        if sys.byteorder == "big":
+            samples.byteswap()
+        return samples.tobytes()
     else:
-        return _waveforms_numpy(code, steps)
+        samples = numpy.column_stack([as_float(wave) for wave in waves])
+        if fmt == "i16":
+            return numpy.rint(samples * _INT16_SCALE).astype("<i2").tobytes()
+        return samples.astype("<f4").tobytes()
 
 
-def save(waves, filename):
+def _is_wave(obj):
+    """
+    Check whether an object is a single wave (or time array), not a block of waves
+    :param obj: object to check
+    :return: True for a TimeAxis and for one-dimensional arrays and sequences of numbers
+    """
+    if isinstance(obj, (TimeAxis, array.array)):
+        return True
+    if not slow and isinstance(obj, numpy.ndarray):
+        return obj.ndim == 1
+    return isinstance(obj, (list, tuple)) and (not obj or not hasattr(obj[0], "__len__"))
+
+
+def save(waves, filename, fmt="txt"):
     """
     Save given waveform arrays to file
-    :param waves: array of times and waveforms (t, am, fm, pm)
+    :param waves: array of times and waveforms (t, am, fm, pm) or iterable of such arrays (see waveforms_iter)
+                  If the time is a TimeAxis, it is not stored in NumPy array files (npy only holds am, fm and pm,
+                  npz holds steps instead of t).
     :param filename: filename to save this file to
+    :param fmt: file format, one of FORMATS
+    :raise RuntimeError: format is unknown or not available without numpy
     """
-    if slow:
+    # A single set of waves holds four waves, an iterable of blocks holds tuples of waves (or is a generator)
+    single = isinstance(waves, WaveformSet) or (hasattr(waves, "__len__") and len(waves) == 4 and _is_wave(waves[0]))
+    blocks = [tuple(waves)] if single else waves
+    if fmt == "txt":
         with open(filename, "w") as file:
-            file.write("# t [cycle] AM          FM          PM\n")
-            for i in range(len(waves[0])):
-                file.write(("{+9.8f} " * len(waves)).format(*waves).strip())
-            file.write("# Created with Waveform Modulator, (c) 2020 Konstantin Köhring (@galaxy102), MIT license")
-            file.close()
+            file.write("# {}\n".format(_HEADER))
+            for block in blocks:
+                if slow:
+                    for row in zip(*block):
+                        file.write(" ".join("{:+9.8f}".format(val) for val in row) + "\n")
+                else:
+                    numpy.savetxt(file, numpy.column_stack([as_float(wave) for wave in block]), "%+9.8f")
+            file.write("# {}\n".format(_FOOTER))
+    elif fmt in ("f32", "i16"):
+        with open(filename, "wb") as file:
+            for block in blocks:
+                file.write(_raw_bytes(block[1:], fmt))
+    elif fmt in ("npy", "npz") and not slow:
+        # Array files need the whole waveform at once, use save_npy to write .npy files with bounded memory
+        # The waves keep their dtype
+        t, am, fm, pm = zip(*blocks)
+        am, fm, pm = (numpy.concatenate(wave) for wave in (am, fm, pm))
+        if isinstance(t[0], TimeAxis):
+            if fmt == "npy":
+                numpy.save(filename, numpy.column_stack((am, fm, pm)))
+            else:
+                numpy.savez_compressed(filename, steps=t[0].steps, am=am, fm=fm, pm=pm)
+        else:
+            t = numpy.concatenate(t)
+            if fmt == "npy":
+                numpy.save(filename, numpy.column_stack((t.astype(_table_dtype(am.dtype)), am, fm, pm)))
+            else:
+                numpy.savez_compressed(filename, t=t, am=am, fm=fm, pm=pm)
     else:
-        numpy.savetxt(filename, numpy.array(waves).T, "%+9.8f", header="t [cycle] AM          FM          PM",
-                      footer="Created with Waveform Modulator, (c) 2020 Konstantin Köhring (@galaxy102), MIT license")
+        logging.log(logging.ERROR, "Could not save {} as {}.".format(filename, fmt))
+        raise RuntimeError("Invalid format.")
 
+
+def _table_dtype(dtype):
+    """
+    Check the dtype of a .npy table, which holds the time next to the waves
+    :param dtype: sample data type of the waves
+    :return: dtype of the table
+    :raise RuntimeError: dtype is not float64 (lower precision cannot represent the time of long waveforms)
+    """
+    dtype = numpy.dtype(dtype)
+    if dtype != numpy.float64:
+        logging.log(logging.ERROR, "Could not store time as {}.".format(dtype))
+        raise RuntimeError("NumPy tables with time need float64, use implicit_time, npz or raw formats instead.")
+    return dtype
+
+
+def save_npy(code, filename, steps=200, workers=1, dtype=None, implicit_time=False, length=None):
+    """
+    Calculate the waveforms for a given binary code directly into a memory-mapped .npy file
+    The file holds one column per wave (t, am, fm, pm) like the text format. It is stored in Fortran order, so every
+    column is contiguous and may be memory-mapped again with numpy.load(filename, mmap_mode="r").
+    :param code: code to modulate, or iterable of consecutive parts of it if length is given (see waveforms_stream)
+    :param filename: filename to save this file to
+    :param steps: steps per interval to calculate
+    :param workers: number of threads to use (None for one per CPU)
+    :param dtype: data type of the table (default: float64), must be float64 unless implicit_time is set
+    :param implicit_time: True to leave out the time column (t[i] == i / steps)
+    :param length: total number of bits of the parts of the code, None if code is not given in parts
+    :raise RuntimeError: numpy is not available or dtype is not float64 with time
+    :raise ValueError: parts of the code do not match length
+    """
+    if slow:
+        logging.log(logging.ERROR, "Could not write {} without numpy.".format(filename))
+        raise RuntimeError("NumPy is required for .npy output.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if length is None:
+        codes = (code,)
+        length = len(code)
+    else:
+        codes = code
+    if implicit_time:
+        data = numpy.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=(length * steps, 3),
+                                            fortran_order=True)
+        out = (TimeAxis(length * steps, steps),) + tuple(data[:, col] for col in range(3))
+    else:
+        data = numpy.lib.format.open_memmap(filename, mode="w+", dtype=_table_dtype(dtype),
+                                            shape=(length * steps, 4), fortran_order=True)
+        out = tuple(data[:, col] for col in range(4))
+    offset = 0
+    phase = None  # Phase state is carried from part to part
+    for part in codes:
+        bits = _bits_numpy(part)
+        if offset + len(bits) > length:
+            # The surplus bits fail the length check below
+            offset += len(bits)
+            break
+        # Only the chunk being calculated needs to be resident, the rest is paged out to the file
+        _fill_numpy(bits, steps, tuple(wave if isinstance(wave, TimeAxis)
+                                       else wave[offset * steps:(offset + len(bits)) * steps] for wave in out),
+                    workers, offset, phase)
+        phase = _phase_after(bits, phase)
+        offset += len(bits)
+    data.flush()
+    del data
+    if offset != length:
+        logging.log(logging.ERROR, "Code does not match the length {} of {}.".format(length, filename))
+        raise ValueError("Invalid code length.")
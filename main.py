@@ -21,39 +21,305 @@ Waveform modulator for Bin, BCD and ASCII input to AM, FM and PM output
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import lib.plot
 import lib.gui
+import lib.encoder
 import lib.waveform
 import argparse
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+import stat
+import sys
+
+# Inputs longer than this are not used as output file name, the hash of the input is used instead
+_MAX_NAME_LENGTH = 64
+
+
+class _EmptyRange(ValueError):
+    """
+    Raised if --range holds no bits of the input
+    """
+
+
+def _bit_range(text):
+    """
+    Parse a bit range given on the command line
+    :param text: range as START:END, either may be omitted (Python slice notation)
+    :return: slice of the bits
+    :raise argparse.ArgumentTypeError: malformed range
+    """
+    try:
+        start, end = (int(val) if val else None for val in text.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid range {}, please use START:END.".format(text))
+    return slice(start, end)
+
+
+def _window(args, inp):
+    """
+    Get the window of bits to calculate and plot
+    :param args: parsed command line arguments
+    :param inp: code to modulate
+    :return: index of the first bit, index following the last bit
+    :raise _EmptyRange: the window holds no bits of the code
+    """
+    start, end, _ = args.range.indices(len(inp))
+    if start >= end:
+        raise _EmptyRange("Range {}:{} holds no bits of the input of {} bits."
+                         .format("" if args.range.start is None else args.range.start,
+                                 "" if args.range.stop is None else args.range.stop, len(inp)))
+    return start, end
+
+
+def _calculate(args, inp, progress=None):
+    """
+    Calculate the requested waveforms
+    :param args: parsed command line arguments
+    :param inp: code to modulate (see lib.waveform.waveforms)
+    :param progress: function to call with the calculated fraction (0.0 .. 1.0) after each chunk, an exception raised by
+                     it aborts the calculation
+    :return: lib.waveform.WaveformSet holding the time and the requested waveforms of the bits in --range
+    :raise _EmptyRange: --range holds no bits of the code
+    """
+    start, end = _window(args, inp)
+    waves = lib.waveform.waveforms(inp, steps=args.steps, workers=args.workers or None, dtype=args.dtype,
+                                   implicit_time=args.implicit_time, start_bit=start, end_bit=end)
+    # Only the requested waveforms are calculated
+    names = ["t"] + args.schemes.split(",")
+    for idx, name in enumerate(names):
+        if progress is not None:
+            waves.progress = lambda done, total, idx=idx: progress((idx + done / total) / len(names))
+        getattr(waves, name)
+    return waves
+
+
+def _plot(args, inp, waves=None, **kwargs):
+    """
+    Calculate and plot the requested waveforms
+    :param args: parsed command line arguments
+    :param inp: code to modulate (see lib.waveform.waveforms)
+    :param waves: waveforms of the code (see _calculate), None to calculate them
+    :param kwargs: further arguments for lib.plot.plot_waveforms
+    :raise _EmptyRange: --range holds no bits of the code
+    """
+    # Matplotlib is only loaded if charts are plotted
+    import lib.plot
+    if waves is None:
+        waves = _calculate(args, inp)
+    start, end = _window(args, inp)
+    lib.plot.plot_waveforms(inp[start:end], waves.t,
+                            **{scheme: getattr(waves, scheme) for scheme in args.schemes.split(",")}, **kwargs)
+
+
+def _embed(args, master):
+    """
+    Embed the chart into the GUI
+    :param args: parsed command line arguments
+    :param master: Tk widget to embed the chart into
+    :return: function to plot the waveforms into the chart (see _plot), function to preview an input in the chart
+    """
+    import lib.plot
+    canvas = lib.plot.PlotCanvas(master)
+    # The preview only calculates the bits following the common prefix of the previous and the new input
+    stream = lib.waveform.WaveformStream(args.steps, args.schemes.split(","), args.dtype)
+
+    def preview(inp):
+        stream.edit(inp)
+        try:
+            start, end = _window(args, inp)
+        except ValueError:
+            # Nothing to show until the input reaches the range
+            return
+        _, *waves = stream.view()
+        # Only the samples of the range are shown
+        t = lib.waveform.TimeAxis((end - start) * args.steps, args.steps, start * args.steps)
+        waves = [None if wave is None else wave[start * args.steps:end * args.steps] for wave in waves]
+        lib.plot.plot_waveforms(inp[start:end], t, *waves, target="canvas", canvas=canvas, fit=False)
+
+    return functools.partial(_plot, args, target="canvas", canvas=canvas), preview
+
+
+def _store(args, inp, path=None):
+    """
+    Store the waveform chart or data for one input
+    :param args: parsed command line arguments
+    :param inp: formatted input, ignored if path is given
+    :param path: file to read the formatted (or raw) input from, - for stdin
+    :raise ValueError: invalid input
+    """
+    digest = hashlib.sha256()
+    with contextlib.ExitStack() as stack:
+        if path is None:
+            digest.update(inp.encode())
+            name = inp if len(inp) <= _MAX_NAME_LENGTH else digest.hexdigest()[:16]
+            codes = (lib.gui._evaluate_input(inp),)
+        else:
+            # The name is known after reading the whole input
+            name = None
+            file = stack.enter_context(lib.encoder.open_input(path))
+            if args.raw:
+                codes = lib.encoder.encode_raw(file, digest)
+            else:
+                codes = lib.encoder.encode_stream(file, digest)
+        if args.store_wave is None:
+            # Plotting needs the whole code
+            inp = b"".join(codes)
+            _plot(args, inp, target="file", filename="wave_{}.png".format(name or digest.hexdigest()[:16]))
+        else:
+            # The file is written under a name of this process and only takes its final name when it is complete, so
+            # a failed run never leaves a partial file or removes the result of an earlier run
+            filename = "wave_{}.part.{}".format(os.getpid(), args.format)
+            if args.range != slice(None):
+                # The window needs the whole code, but only its samples are calculated
+                codes = (b"".join(codes),)
+                _window(args, codes[0])
+            try:
+                if args.range != slice(None):
+                    lib.waveform.save(_calculate(args, codes[0]), filename=filename, fmt=args.format)
+                elif args.format == "npy" and not lib.waveform.slow:
+                    # The size of the file is needed up front. It is known for raw regular files, for other input (also
+                    # pipes and devices, which report no size) only the (much smaller) code is read first.
+                    info = os.fstat(file.fileno()) if args.raw and path != "-" else None
+                    if info is not None and stat.S_ISREG(info.st_mode):
+                        length = info.st_size * 8
+                    else:
+                        codes, length = b"".join(codes), None
+                    lib.waveform.save_npy(codes, filename=filename, steps=args.steps, workers=args.workers or None,
+                                          dtype=args.dtype, implicit_time=args.implicit_time, length=length)
+                else:
+                    lib.waveform.save(lib.waveform.waveforms_stream(codes, steps=args.steps, dtype=args.dtype,
+                                                                    implicit_time=args.implicit_time,
+                                                                    workers=args.workers or None),
+                                      filename=filename, fmt=args.format)
+            except BaseException:
+                # The input is read while writing (and may turn out invalid)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(filename)
+                raise
+            os.replace(filename, "wave_{}.{}".format(name or digest.hexdigest()[:16], args.format))
+
+
+def _store_batch_entry(args, inp):
+    """
+    Store the waveform chart or data for one input of a batch, errors are logged instead of raised
+    :param args: parsed command line arguments
+    :param inp: formatted input
+    :return: True on success
+    """
+    try:
+        _store(args, inp)
+    except ValueError as e:
+        logging.log(logging.ERROR, "Skipping batch input {}: {}".format(inp[:_MAX_NAME_LENGTH], e))
+        return False
+    return True
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Modulate Waveforms", formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("--nogui", help="Use CLI by preference", action="store_true")
     parser.add_argument("--steps", type=int, help="Steps to use for plotting per interval", default=200)
+    parser.add_argument("--dtype", help="Sample data type of the waves (integer types are scaled to full range)",
+                        choices=("float64", "float32", "float16", "int16", "int8"), default="float64")
+    parser.add_argument("--schemes",
+                        help="Comma-separated modulation schemes to calculate and plot (default: am,fm,pm)",
+                        action="store", default=",".join(lib.waveform.SCHEMES))
+    parser.add_argument("--implicit-time",
+                        help="Do not allocate the time array, calculate the time from the sample index on demand.\n"
+                             "npy and npz files of --store-wave will not contain the time (npz holds steps instead).",
+                        action="store_true")
+    parser.add_argument("--range",
+                        help="Calculate and plot only the bits START to END (exclusive) of the input, e.g. 1000:1064.\n"
+                             "Either may be omitted, negative values count from the end of the input.\n"
+                             "The samples of the other bits are not calculated.",
+                        action="store", metavar="START:END", type=_bit_range, default=slice(None))
+    parser.add_argument("--workers", type=int, help="Threads to use for calculation (0 for one per CPU)", default=1)
     parser.add_argument("--store-plot",
                         help="Create the waveform chart for the given formatted input.\n"
                              "The input is interpreted as Binary.\n"
                              "To trigger interpretation as 7-bit ASCII, prefix the input with a_.\n"
                              "To trigger interpretation as 4-bit BCD, prefix the input with d_.\n"
-                             "The file will be saved as wave_INPUT.png to the current directory.",
-                        action="store", metavar="INPUT", type=str)
+                             "Use - to read the input from stdin, omit it to read it from --input-file.\n"
+                             "The file will be saved as wave_INPUT.png to the current directory.\n"
+                             "For long inputs and inputs read from files, INPUT is replaced by its hash.",
+                        action="store", metavar="INPUT", type=str, nargs="?", const="")
     parser.add_argument("--store-wave",
                         help="Create the waveform data for the given formatted input.\n"
                              "The input is interpreted as Binary.\n"
                              "To trigger interpretation as 7-bit ASCII, prefix the input with a_.\n"
                              "To trigger interpretation as 4-bit BCD, prefix the input with d_.\n"
-                             "The file will be saved as wave_INPUT.txt to the current directory.",
-                        action="store", metavar="INPUT", type=str)
+                             "Use - to read the input from stdin, omit it to read it from --input-file.\n"
+                             "The file will be saved as wave_INPUT.FORMAT to the current directory.\n"
+                             "For long inputs and inputs read from files, INPUT is replaced by its hash.",
+                        action="store", metavar="INPUT", type=str, nargs="?", const="")
+    parser.add_argument("--input-file",
+                        help="Read the formatted input for --store-plot or --store-wave from the given file.\n"
+                             "Use - to read from stdin.\n"
+                             "The file is read and modulated chunk by chunk.\n"
+                             "Line breaks are ignored, except for inner line breaks of ASCII input.",
+                        action="store", metavar="PATH", type=str)
+    parser.add_argument("--raw",
+                        help="Modulate the raw content of --input-file (or stdin) with 8 bits per byte.\n"
+                             "Regular files are memory-mapped and never read as a whole.",
+                        action="store_true")
+    parser.add_argument("--format",
+                        help="File format for --store-wave (default: txt).\n"
+                             "txt: text table of t, AM, FM and PM\n"
+                             "npy: NumPy array of t, AM, FM and PM columns, written memory-mapped\n"
+                             "     (--dtype float64 only, unless --implicit-time is given)\n"
+                             "npz: compressed NumPy arrays t, am, fm and pm\n"
+                             "f32: raw little-endian float32 samples, AM, FM and PM interleaved\n"
+                             "i16: raw little-endian int16 samples scaled to full range, AM, FM and PM interleaved",
+                        choices=lib.waveform.FORMATS, default="txt")
+    parser.add_argument("--batch",
+                        help="Process the formatted inputs listed in the given file, one per line, in one process.\n"
+                             "Empty lines and lines starting with # are skipped.\n"
+                             "Use together with --store-plot or --store-wave without INPUT (default: --store-plot).\n"
+                             "Inputs that cannot be interpreted are logged and skipped.",
+                        action="store", metavar="FILE", type=str)
+    parser.add_argument("--jobs", type=int,
+                        help="Worker processes to share the --batch inputs (0 for one per CPU, default: 1)", default=1)
     args = parser.parse_args()
+    if not set(args.schemes.split(",")) <= set(lib.waveform.SCHEMES):
+        parser.error("Invalid schemes {}.".format(args.schemes))
+    if args.format == "npy" and args.dtype != "float64" and not args.implicit_time:
+        # The table holds the time next to the waves, lower precision cannot represent the time of long waveforms
+        parser.error("--format npy needs --dtype float64, unless --implicit-time is given.")
+
     if args.store_plot is not None and args.store_wave is not None:
         print("Please decide for either plotting or storing the waveform.")
-    if args.store_plot is None and args.store_wave is None:
-        lib.gui.start(lambda inp: lib.plot.plot_waveforms(inp, *lib.waveform.waveforms(inp, steps=args.steps)),
-                      force_nogui=args.nogui)
-    elif args.store_wave is None:
-        inp = lib.gui._evaluate_input(args.store_plot)
-        lib.plot.plot_waveforms(inp, *lib.waveform.waveforms(inp, steps=args.steps),
-                                target="file", filename="wave_{}.png".format(args.store_plot))
+    if args.batch is not None:
+        if args.store_plot or args.store_wave or args.input_file is not None or args.raw:
+            parser.error("Please give the inputs of --batch in FILE only.")
+        if args.store_wave is None:
+            args.store_plot = ""
+        with lib.encoder.open_input(args.batch) as file:
+            inputs = [line.strip() for line in file.read().decode().splitlines()]
+        inputs = [inp for inp in inputs if inp and not inp.startswith("#")]
+        store = functools.partial(_store_batch_entry, args)
+        if args.jobs == 1:
+            results = list(map(store, inputs))
+        else:
+            import multiprocessing
+            # Each worker process keeps its templates and figure for all of its inputs
+            with multiprocessing.Pool(args.jobs or None) as pool:
+                results = pool.map(store, inputs, chunksize=max(1, len(inputs) // (4 * (args.jobs or os.cpu_count()))))
+        if not all(results):
+            sys.exit(1)
+    elif args.store_plot is None and args.store_wave is None:
+        lib.gui.start(functools.partial(_plot, args), force_nogui=args.nogui,
+                      calculate=functools.partial(_calculate, args), embed=functools.partial(_embed, args))
     else:
-        inp = lib.gui._evaluate_input(args.store_wave)
-        lib.waveform.save(lib.waveform.waveforms(inp, steps=args.steps), filename="wave_{}.txt".format(args.store_wave))
+        inp = args.store_wave if args.store_wave is not None else args.store_plot
+        path = args.input_file if args.input_file is not None else ("-" if inp == "-" else None)
+        if path is None:
+            if args.raw:
+                parser.error("Please use --input-file or - as INPUT for raw input.")
+            if not inp:
+                parser.error("Please give the INPUT or use --input-file.")
+        try:
+            _store(args, inp, path)
+        except _EmptyRange as e:
+            # The length of the input is only known after reading it, nothing has been written yet
+            parser.error(str(e))
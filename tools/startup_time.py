@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+Measure the startup time of main.py and list the backends it loads
+"""
+# Published under the MIT license
+#
+# Copyright 2020 Konstantin Köhring (@galaxy102)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+# to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions
+# of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Entry point to measure
+_MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+# Modules that are only to be loaded if their feature is used
+_BACKENDS = ("numpy", "matplotlib", "tkinter")
+
+# Module name in the output of python -X importtime
+_IMPORT_PATTERN = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| +(\S+)")
+
+
+def _run(args, cwd):
+    """
+    Run main.py once
+    :param args: command line arguments for main.py
+    :param cwd: working directory to run in (output files are written there)
+    :return: wall time of the run in seconds
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, _MAIN] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def _loaded_backends(args, cwd):
+    """
+    Get the backends loaded by a run of main.py
+    :param args: command line arguments for main.py
+    :param cwd: working directory to run in (output files are written there)
+    :return: dictionary of backend name to cumulative import time in seconds (only loaded backends)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", _MAIN] + args, cwd=cwd, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    loaded = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_PATTERN.match(line)
+        if match and match.group(2) in _BACKENDS:
+            loaded[match.group(2)] = int(match.group(1)) / 1e6
+    return loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the startup time of main.py")
+    parser.add_argument("--runs", type=int, help="Number of runs to measure (default: 10)", default=10)
+    parser.add_argument("args", nargs=argparse.REMAINDER,
+                        help="Arguments for main.py (default: --store-wave 0110)")
+    args = parser.parse_args()
+    main_args = [arg for arg in args.args if arg != "--"] or ["--store-wave", "0110"]
+    with tempfile.TemporaryDirectory() as cwd:
+        times = [_run(main_args, cwd) for _ in range(args.runs)]
+        backends = _loaded_backends(main_args, cwd)
+    print("main.py {}".format(" ".join(main_args)))
+    print("  median {:.3f} s, min {:.3f} s of {} runs".format(statistics.median(times), min(times), args.runs))
+    for backend in _BACKENDS:
+        if backend in backends:
+            print("  {:<10} loaded ({:.3f} s import time)".format(backend, backends[backend]))
+        else:
+            print("  {:<10} not loaded".format(backend))